@@ -1,12 +1,15 @@
+import asyncio
 import base64
 import copy
 import datetime
+import inspect
 import logging
 import os
 import random
 import string
 import subprocess
 import sys
+import uuid
 from dataclasses import asdict, dataclass, fields
 from pathlib import Path
 from typing import (
@@ -25,6 +28,7 @@ import allure
 import factory
 import faker
 import httpx
+import jwt
 import pytest
 import urllib3
 from docker.errors import NotFound as ContainerNotFound
@@ -446,6 +450,56 @@ def json_headers(kelvin_token) -> Dict[str, str]:
     }
 
 
+def make_token(lifetime: int = 3600) -> str:
+    expiry = datetime.datetime.utcnow() + datetime.timedelta(seconds=lifetime)
+    return jwt.encode({"exp": expiry, "jti": uuid.uuid4().hex}, "s3cr3t", algorithm="HS256")
+
+
+class FakeKelvinAPI:
+    """
+    Kelvin API without a server: the token endpoint issues JWTs, all other requests are
+    answered by `handler` (sync or async), which defaults to an empty JSON object.
+    """
+
+    def __init__(self):
+        self.host = "localhost"
+        self.requests: List[httpx.Request] = []
+        self.token_requests: List[httpx.Request] = []
+        self.issued_tokens: List[str] = []
+        self.token_lifetime = 3600
+        self.token_delay = 0.0
+        self.handler: Callable[[httpx.Request], Any] = lambda request: httpx.Response(200, json={})
+        self.transport = httpx.MockTransport(self._handle)
+
+    @property
+    def session_kwargs(self) -> Dict[str, Any]:
+        return {
+            "username": "username",
+            "password": "password",
+            "host": self.host,
+            "verify": False,
+            "transport": self.transport,
+        }
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.path.endswith("/token"):
+            self.token_requests.append(request)
+            self.issued_tokens.append(make_token(self.token_lifetime))
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            return httpx.Response(200, json={"access_token": self.issued_tokens[-1]})
+        response = self.handler(request)
+        if inspect.isawaitable(response):
+            response = await response
+        return response
+
+
+@pytest.fixture
+def fake_kelvin_api() -> FakeKelvinAPI:
+    return FakeKelvinAPI()
+
+
 def _test_a_server_configuration(server_config: TestServerConfiguration) -> None:
     logger.info("Testing auth with Kelvin REST API...")
     retrieve_kelvin_access_token(
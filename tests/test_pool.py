@@ -0,0 +1,120 @@
+# Copyright 2026 Univention GmbH
+#
+# http://www.univention.de/
+#
+# All rights reserved.
+#
+# The source code of this program is made available
+# under the terms of the GNU Affero General Public License version 3
+# (GNU AGPL V3) as published by the Free Software Foundation.
+#
+# Binary versions of this program provided by Univention to you as
+# well as other copyrighted, protected or trademarked materials like
+# Logos, graphics, fonts, specific documentations and configurations,
+# cryptographic keys etc. are subject to a license agreement between
+# you and Univention and not subject to the GNU AGPL V3.
+#
+# In the case you use this program under the terms of the GNU AGPL V3,
+# the program is provided in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License with the Debian GNU/Linux or Univention distribution in file
+# /usr/share/common-licenses/AGPL-3; if not, see
+# <http://www.gnu.org/licenses/>.
+
+import asyncio
+
+import httpx
+import pytest
+
+from ucsschool.kelvin.client import SessionPool
+
+CREDENTIALS = {"username": "admin", "password": "s3cr3t"}
+
+
+@pytest.fixture
+def pool_kwargs(fake_kelvin_api):
+    fake_kelvin_api.handler = lambda request: httpx.Response(200, json={"host": request.url.host})
+    return {"transport": fake_kelvin_api.transport}
+
+
+async def use(pool: SessionPool, host: str) -> dict:
+    async with pool.session(host=host, **CREDENTIALS) as session:
+        return await session.get(f"https://{host}/ucsschool/kelvin/v1/schools/")
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_sessions(pool_kwargs, fake_kelvin_api):
+    async with SessionPool(max_open=2, **pool_kwargs) as pool:
+        assert await use(pool, "a") == {"host": "a"}
+        assert await use(pool, "a") == {"host": "a"}
+        stats = pool.stats
+        assert (stats.sessions, stats.open, stats.in_use) == (1, 1, 0)
+        assert (stats.hits, stats.misses, stats.evictions) == (1, 1, 0)
+    assert pool.stats.open == 0
+    assert [r.url.host for r in fake_kelvin_api.token_requests] == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_pool_evicts_lru_and_keeps_tokens(pool_kwargs, fake_kelvin_api):
+    async with SessionPool(max_open=2, **pool_kwargs) as pool:
+        await use(pool, "a")
+        await use(pool, "b")
+        await use(pool, "a")
+        await use(pool, "c")  # evicts b, the least recently used
+        assert pool._sessions[("b", "admin")]._client is None
+        assert pool.stats.evictions == 1
+        await use(pool, "b")  # evicts a
+        stats = pool.stats
+        assert (stats.sessions, stats.open, stats.evictions) == (3, 2, 2)
+        assert (stats.hits, stats.misses) == (1, 4)
+    # the token of b survived its eviction
+    assert [r.url.host for r in fake_kelvin_api.token_requests] == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_pool_does_not_evict_sessions_in_use(pool_kwargs):
+    async with SessionPool(max_open=1, **pool_kwargs) as pool:
+        async with pool.session(host="a", **CREDENTIALS):
+            waiting = asyncio.ensure_future(use(pool, "b"))
+            await asyncio.sleep(0.05)
+            assert not waiting.done()
+            assert pool.stats.in_use == 1
+        assert await waiting == {"host": "b"}
+        assert pool.stats.evictions == 1
+
+
+def test_pool_max_open_must_be_positive():
+    with pytest.raises(ValueError):
+        SessionPool(max_open=0)
+
+
+@pytest.mark.asyncio
+async def test_pool_cancelled_waiter_is_not_in_use(pool_kwargs):
+    async with SessionPool(max_open=1, **pool_kwargs) as pool:
+        async with pool.session(host="a", **CREDENTIALS):
+            waiting = asyncio.ensure_future(use(pool, "b"))
+            await asyncio.sleep(0.05)
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+        assert pool.stats.in_use == 0
+        assert await use(pool, "c") == {"host": "c"}
+
+
+def test_pool_condition_created_in_running_loop(pool_kwargs):
+    pool = SessionPool(max_open=1, **pool_kwargs)
+    assert pool._condition is None
+
+    async def use_concurrently():
+        async with pool:
+            return await asyncio.gather(use(pool, "a"), use(pool, "b"))
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(use_concurrently()) == [{"host": "a"}, {"host": "b"}]
+    finally:
+        loop.close()
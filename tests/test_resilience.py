@@ -0,0 +1,445 @@
+# Copyright 2026 Univention GmbH
+#
+# http://www.univention.de/
+#
+# All rights reserved.
+#
+# The source code of this program is made available
+# under the terms of the GNU Affero General Public License version 3
+# (GNU AGPL V3) as published by the Free Software Foundation.
+#
+# Binary versions of this program provided by Univention to you as
+# well as other copyrighted, protected or trademarked materials like
+# Logos, graphics, fonts, specific documentations and configurations,
+# cryptographic keys etc. are subject to a license agreement between
+# you and Univention and not subject to the GNU AGPL V3.
+#
+# In the case you use this program under the terms of the GNU AGPL V3,
+# the program is provided in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License with the Debian GNU/Linux or Univention distribution in file
+# /usr/share/common-licenses/AGPL-3; if not, see
+# <http://www.gnu.org/licenses/>.
+
+import asyncio
+import datetime
+import email.utils
+import time
+
+import httpx
+import pytest
+from tenacity import RetryCallState
+
+from ucsschool.kelvin.client.exceptions import CircuitOpen
+from ucsschool.kelvin.client.resilience import (
+    AdaptiveConcurrencyLimiter,
+    AdaptiveTimeouts,
+    BackoffGate,
+    CircuitBreaker,
+    HedgingPolicy,
+    HostRouter,
+    RetryBudget,
+    RetryPolicy,
+    TokenBucket,
+    deadline,
+    deadline_remaining,
+    retry_after_seconds,
+)
+
+
+def retry_state_with_result(policy: RetryPolicy, response: httpx.Response) -> RetryCallState:
+    retry_state = RetryCallState(policy.retrying(), fn=None, args=(), kwargs={})
+    retry_state.set_result(response)
+    return retry_state
+
+
+@pytest.mark.asyncio
+async def test_limiter_enforces_limit():
+    limiter = AdaptiveConcurrencyLimiter(4)
+    running = 0
+    max_running = 0
+
+    async def task():
+        nonlocal running, max_running
+        await limiter.acquire()
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        limiter.release()
+
+    await asyncio.gather(*(task() for _ in range(20)))
+    assert max_running == 4
+    assert limiter.in_flight == 0
+    assert limiter.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_limiter_queue_depth():
+    limiter = AdaptiveConcurrencyLimiter(2)
+    await limiter.acquire()
+    await limiter.acquire()
+    waiters = [asyncio.ensure_future(limiter.acquire()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert limiter.queue_depth == 3
+    limiter.release()
+    await asyncio.sleep(0)
+    assert limiter.queue_depth == 2
+    assert waiters[0].done()
+    for waiter in waiters[1:]:
+        waiter.cancel()
+    await asyncio.gather(*waiters[1:], return_exceptions=True)
+    assert limiter.queue_depth == 0
+    assert limiter.in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_limiter_cancel_and_release_in_same_tick():
+    limiter = AdaptiveConcurrencyLimiter(1)
+    started = await limiter.acquire()
+    waiters = [asyncio.ensure_future(limiter.acquire()) for _ in range(2)]
+    await asyncio.sleep(0)
+    waiters[0].cancel()
+    limiter.release(started)
+    with pytest.raises(asyncio.CancelledError):
+        await waiters[0]
+    await waiters[1]
+    assert limiter.queue_depth == 0
+    assert limiter.in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_limiter_multiplicative_decrease_additive_increase():
+    limiter = AdaptiveConcurrencyLimiter(16, min_limit=2)
+    started = [await limiter.acquire() for _ in range(3)]
+    # all three were dispatched before the decrease: only the first one lowers the limit
+    for start in started:
+        limiter.release(start, overloaded=True)
+    assert limiter.limit == 8
+    for _ in range(3):
+        limiter.release(await limiter.acquire(), overloaded=True)
+    assert limiter.limit == 2
+    for _ in range(10):
+        limiter.release(await limiter.acquire())
+    assert 2 < limiter.limit < 16
+    for _ in range(500):
+        limiter.release(await limiter.acquire())
+    assert limiter.limit == 16
+
+
+@pytest.mark.asyncio
+async def test_limiter_latency_threshold():
+    limiter = AdaptiveConcurrencyLimiter(10, latency_threshold=0.01)
+    started = await limiter.acquire()
+    await asyncio.sleep(0.02)
+    limiter.release(started)
+    assert limiter.limit == 5
+
+
+@pytest.mark.asyncio
+async def test_limiter_no_feedback():
+    limiter = AdaptiveConcurrencyLimiter(10)
+    await limiter.acquire()
+    limiter.release(None, overloaded=True)
+    assert limiter.limit == 10
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [(None, None), ("3", 3.0), ("1.5", 1.5), ("-1", 0.0), ("soon", None)],
+)
+def test_retry_after_seconds(value, expected):
+    headers = {"Retry-After": value} if value is not None else {}
+    assert retry_after_seconds(httpx.Response(503, headers=headers)) == expected
+
+
+def test_retry_after_seconds_http_date():
+    date = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=30)
+    response = httpx.Response(503, headers={"Retry-After": email.utils.format_datetime(date)})
+    assert 25 < retry_after_seconds(response) <= 30
+
+
+def test_retry_policy_honors_retry_after():
+    policy = RetryPolicy(retries=3, max_retry_after=60)
+    response = httpx.Response(429, headers={"Retry-After": "7"})
+    assert policy.wait(retry_state_with_result(policy, response)) == 7
+    response = httpx.Response(429, headers={"Retry-After": "600"})
+    assert policy.wait(retry_state_with_result(policy, response)) == 60
+
+
+def test_retry_policy_decorrelated_jitter():
+    policy = RetryPolicy(retries=10, min_pause=1, max_pause=20)
+    pauses = set()
+    for _ in range(20):
+        retry_state = retry_state_with_result(policy, httpx.Response(502))
+        last_pause = 1
+        for _ in range(10):
+            retry_state.attempt_number += 1
+            pause = policy.wait(retry_state)
+            assert 1 <= pause <= min(20, last_pause * 3)
+            pauses.add(pause)
+            last_pause = pause
+    assert len(pauses) > 100
+
+
+def test_retry_policy_pause():
+    policy = RetryPolicy(min_pause=1, max_pause=20)
+    assert 1 <= policy.pause() <= 3
+    assert 1 <= policy.pause(5) <= 15
+    assert policy.pause(100) <= 20
+    assert len({policy.pause() for _ in range(20)}) > 1
+
+
+def test_retry_policy_copy():
+    policy = RetryPolicy(retries=3, min_pause=1, max_pause=10, status_codes=[502])
+    copy = policy.copy(min_pause=0.5)
+    assert copy is not policy
+    assert (copy.retries, copy.min_pause, copy.max_pause) == (3, 0.5, 10)
+    assert copy.status_codes == (502,)
+    assert policy.min_pause == 1
+
+
+def test_retry_policy_should_retry():
+    policy = RetryPolicy(retries=1)
+    assert policy.should_retry(retry_state_with_result(policy, httpx.Response(503)))
+    assert not policy.should_retry(retry_state_with_result(policy, httpx.Response(404)))
+    retry_state = RetryCallState(policy.retrying(), fn=None, args=(), kwargs={})
+    retry_state.set_exception((httpx.ConnectError, httpx.ConnectError("refused"), None))
+    assert policy.should_retry(retry_state)
+    retry_state.set_exception((ValueError, ValueError(), None))
+    assert not policy.should_retry(retry_state)
+
+
+@pytest.mark.asyncio
+async def test_backoff_gate():
+    gate = BackoffGate(default_pause=0.1)
+    assert gate.remaining == 0
+    started = time.monotonic()
+    await gate.wait()
+    assert time.monotonic() - started < 0.05
+    gate.close()
+    assert 0 < gate.remaining <= 0.1
+    gate.close(0.3)
+    # shorter pauses don't shorten the current one
+    gate.close(0.01)
+    assert gate.remaining > 0.2
+    await gate.wait()
+    assert time.monotonic() - started >= 0.3
+    assert gate.remaining == 0
+
+
+@pytest.mark.asyncio
+async def test_backoff_gate_max_pause():
+    gate = BackoffGate(max_pause=0.1)
+    gate.close(3600)
+    assert gate.remaining <= 0.1
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_rate():
+    bucket = TokenBucket(rate=50, burst=5)
+    started = time.monotonic()
+    for _ in range(5):
+        await bucket.acquire()
+    # burst is available right away
+    assert time.monotonic() - started < 0.05
+    await asyncio.gather(*(bucket.acquire() for _ in range(10)))
+    assert 0.18 <= time.monotonic() - started < 0.4
+
+
+def test_token_bucket_try_acquire():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert 0 < bucket.try_acquire() <= 0.1
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_cancel_returns_token():
+    bucket = TokenBucket(rate=10)
+    await bucket.acquire()
+    waiter = asyncio.ensure_future(bucket.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    started = time.monotonic()
+    await bucket.acquire()
+    assert time.monotonic() - started < 0.15
+
+
+@pytest.mark.parametrize("rate,burst", [(0, 1), (-1, 1), (1, 0)])
+def test_token_bucket_invalid(rate, burst):
+    with pytest.raises(ValueError):
+        TokenBucket(rate, burst)
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, min_retries=2)
+    assert budget.try_spend()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    for _ in range(4):
+        budget.record_success()
+    assert budget.successes == 4
+    assert budget.try_spend()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    assert budget.retries == 4
+
+
+def test_retry_budget_window(mocker):
+    now = 1000.0
+    mocker.patch("ucsschool.kelvin.client.resilience.time.monotonic", side_effect=lambda: now)
+    budget = RetryBudget(ratio=0, min_retries=1, window=10)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    now += 5
+    assert not budget.try_spend()
+    now += 5
+    assert budget.try_spend()
+
+
+def test_circuit_breaker(mocker):
+    now = 1000.0
+    mocker.patch("ucsschool.kelvin.client.resilience.time.monotonic", side_effect=lambda: now)
+    breaker = CircuitBreaker(failure_threshold=3, cool_down=30)
+    for _ in range(2):
+        breaker.before_request()
+        breaker.record_failure()
+    breaker.record_success()
+    assert breaker.failures == 0
+    for _ in range(3):
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.before_request()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_request("http://example.com")
+    now += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # only a single request is let through
+    breaker.before_request()
+    with pytest.raises(CircuitOpen):
+        breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    now += 30
+    breaker.before_request()
+    breaker.record_ignored()
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_request()
+
+
+def test_hedging_policy_delay():
+    url = "https://h/ucsschool/kelvin/v1/users/demo_student"
+    hedging = HedgingPolicy(percentile=90, min_delay=0.01, initial_delay=0.5, min_samples=10)
+    assert hedging.delay("GET", url) == 0.5
+    for latency in range(1, 11):
+        hedging.record_latency("GET", url, latency / 10)
+    assert hedging.delay("get", url) == 0.9
+    hedging = HedgingPolicy(min_delay=0.2, min_samples=1)
+    hedging.record_latency("GET", url, 0.001)
+    assert hedging.delay("GET", url) == 0.2
+
+
+def test_hedging_policy_delay_per_endpoint():
+    users = "https://h/ucsschool/kelvin/v1/users/"
+    hedging = HedgingPolicy(min_delay=0.01, initial_delay=0.5, min_samples=5)
+    for _ in range(5):
+        hedging.record_latency("GET", f"{users}demo_student", 0.02)
+        hedging.record_latency("GET", users, 2.0)
+    assert hedging.delay("GET", f"{users}demo_teacher") == 0.02
+    assert hedging.delay("GET", f"{users}?school=DEMOSCHOOL") == 2.0
+    assert hedging.delay("HEAD", f"{users}demo_student") == 0.5
+    assert hedging.delay("GET", "https://h/ucsschool/kelvin/v1/roles/student") == 0.5
+
+
+def test_deadline():
+    assert deadline_remaining() is None
+    with deadline(10):
+        assert 9 < deadline_remaining() <= 10
+        with deadline(20):
+            # nested deadlines can't extend the outer one
+            assert deadline_remaining() <= 10
+        with deadline(1):
+            assert deadline_remaining() <= 1
+        assert deadline_remaining() > 9
+    assert deadline_remaining() is None
+
+
+def test_retry_policy_stops_at_deadline():
+    policy = RetryPolicy(retries=5, min_pause=1, max_pause=1)
+    retry_state = retry_state_with_result(policy, httpx.Response(502))
+    assert not policy.stop(retry_state)
+    with deadline(0.5):
+        assert policy.stop(retry_state)
+
+
+@pytest.mark.parametrize(
+    "url,endpoint",
+    [
+        ("https://h/ucsschool/kelvin/token", "ucsschool/kelvin/token"),
+        ("https://h/ucsschool/kelvin/v1/users/", "ucsschool/kelvin/v1/users"),
+        ("https://h/ucsschool/kelvin/v1/users/?school=DEMO", "ucsschool/kelvin/v1/users"),
+        ("https://h/ucsschool/kelvin/v1/users/demo", "ucsschool/kelvin/v1/users/*"),
+        ("https://h/ucsschool/kelvin/v1/classes/DEMO/1a", "ucsschool/kelvin/v1/classes/*"),
+    ],
+)
+def test_adaptive_timeouts_endpoint(url, endpoint):
+    assert AdaptiveTimeouts().endpoint(url) == endpoint
+
+
+def test_adaptive_timeouts():
+    timeouts = AdaptiveTimeouts(percentile=90, multiplier=2, floor=0.5, ceiling=30, min_samples=10)
+    user_url = "https://h/ucsschool/kelvin/v1/users/demo"
+    role_url = "https://h/ucsschool/kelvin/v1/roles/student"
+    for latency in range(1, 11):
+        assert timeouts.timeout("GET", user_url) is None
+        timeouts.record_latency("GET", user_url, latency)
+        timeouts.record_latency("get", role_url, latency / 100)
+        timeouts.record_latency("PUT", user_url, latency * 10)
+    assert timeouts.timeout("GET", "https://h/ucsschool/kelvin/v1/users/other") == 18
+    assert timeouts.timeout("GET", role_url) == 0.5
+    assert timeouts.timeout("PUT", user_url) == 30
+    assert timeouts.timeout("HEAD", user_url) is None
+
+
+def test_host_router_least_outstanding():
+    router = HostRouter("primary", ["replica1", "replica2"])
+    assert router.candidates("POST") == ["primary"]
+    assert router.candidates("put") == ["primary"]
+    router.acquire("replica1")
+    assert router.candidates("GET") == ["replica2", "replica1", "primary"]
+    router.acquire("replica2")
+    router.acquire("replica2")
+    assert router.candidates("HEAD") == ["replica1", "replica2", "primary"]
+    router.release("replica2")
+    router.release("replica2")
+    router.release("replica1")
+    assert {router.candidates("GET")[0] for _ in range(2)} == {"replica1", "replica2"}
+
+
+def test_host_router_skips_unhealthy_replica():
+    router = HostRouter("primary", ["replica1", "replica2"], cool_down=0.05)
+    router.mark_down("replica1")
+    router.mark_down("primary")
+    assert router.candidates("GET") == ["replica2", "primary"]
+    assert router.is_healthy("primary")
+    time.sleep(0.06)
+    assert router.is_healthy("replica1")
+
+
+def test_host_router_url_for():
+    router = HostRouter("primary", ["replica1:8443"])
+    url = "https://primary/ucsschool/kelvin/v1/users/demo_student?x=1"
+    assert router.url_for(url, "replica1:8443") == (
+        "https://replica1:8443/ucsschool/kelvin/v1/users/demo_student?x=1"
+    )
+    assert router.url_for("https://other/foo", "replica1:8443") == "https://other/foo"
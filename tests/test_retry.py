@@ -25,11 +25,27 @@
 # /usr/share/common-licenses/AGPL-3; if not, see
 # <http://www.gnu.org/licenses/>.
 
+import asyncio
+import time
+
 import httpx
 import pytest
 from async_property import async_property
-
-from ucsschool.kelvin.client.exceptions import NoObject, ServerError
+from conftest import make_token
+
+from ucsschool.kelvin.client import School
+from ucsschool.kelvin.client.exceptions import (
+    CircuitOpen,
+    DeadlineExceeded,
+    NoObject,
+    ServerError,
+)
+from ucsschool.kelvin.client.resilience import (
+    CircuitBreaker,
+    RetryBudget,
+    RetryPolicy,
+    deadline,
+)
 from ucsschool.kelvin.client.session import Session
 
 kelvin_session_kwargs_mock = {
@@ -179,3 +195,364 @@ async def test_session_retry_on_network_errors(mocker, exception):
         resp = await session.get("http://example.com/api")
         assert resp == {"success": True}
         assert mock_get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_session_retry_honors_retry_after(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "0.2"}),
+        httpx.Response(200, json={"success": True}),
+    ]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return responses.pop(0)
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(retries=1, **kelvin_session_kwargs) as session:
+        started = time.monotonic()
+        resp = await session.get("http://example.com/api")
+        elapsed = time.monotonic() - started
+    assert resp == {"success": True}
+    # Retry-After was used instead of the minimum retry pause of 2s
+    assert 0.2 <= elapsed < 1.0
+
+
+@pytest.mark.asyncio
+async def test_session_shared_retry_policy(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    policy = RetryPolicy(retries=2, min_pause=0.01, max_pause=0.01)
+    mock_response_502 = mocker.Mock(spec=httpx.Response)
+    mock_response_502.status_code = 502
+    mock_response_502.reason_phrase = "Bad Gateway"
+    mock_response_502.json.return_value = {"detail": "Server error"}
+
+    mock_get = mocker.patch(
+        "httpx.AsyncClient.get", side_effect=make_async_mock(6 * [mock_response_502])
+    )
+    mock_get.__name__ = "get"
+
+    for _ in range(2):
+        async with Session(retry_policy=policy, **kelvin_session_kwargs_mock) as session:
+            assert session.retry_policy is policy
+            with pytest.raises(ServerError):
+                await session.get("http://example.com/api")
+    assert mock_get.call_count == 6
+
+
+def test_session_retries_and_retry_policy_exclusive():
+    with pytest.raises(TypeError):
+        Session(retries=3, retry_policy=RetryPolicy(retries=3), **kelvin_session_kwargs_mock)
+
+
+def test_session_retry_pause_setters_dont_change_shared_policy():
+    policy = RetryPolicy(retries=2, min_pause=1, max_pause=10)
+    session1 = Session(retry_policy=policy, **kelvin_session_kwargs_mock)
+    session2 = Session(retry_policy=policy, **kelvin_session_kwargs_mock)
+    session1._min_retry_pause = 0.1
+    session1._max_retry_pause = 0.2
+    assert (session1.retry_policy.min_pause, session1.retry_policy.max_pause) == (0.1, 0.2)
+    assert session1.retry_policy.retries == 2
+    assert session2.retry_policy is policy
+    assert (policy.min_pause, policy.max_pause) == (1, 10)
+
+
+@pytest.mark.asyncio
+async def test_session_retry_budget_exhausted(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(502)
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    policy = RetryPolicy(retries=3, min_pause=0, max_pause=0)
+    budget = RetryBudget(ratio=0.1, min_retries=2)
+    async with Session(
+        retry_policy=policy, retry_budget=budget, **kelvin_session_kwargs
+    ) as session:
+        for _ in range(3):
+            with pytest.raises(ServerError):
+                await session.get("http://example.com/api")
+    # 3 requests, but only 2 retries in total
+    assert len(requests) == 5
+    assert budget.retries == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "failure", [httpx.Response(502), httpx.Response(504), httpx.RemoteProtocolError("closed")]
+)
+async def test_session_retries_token_request(failure):
+    token_requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/token"):
+            token_requests.append(request)
+            if len(token_requests) == 1:
+                if isinstance(failure, Exception):
+                    raise failure
+                return failure
+            return httpx.Response(200, json={"access_token": make_token()})
+        return httpx.Response(200, json={})
+
+    policy = RetryPolicy(retries=3, min_pause=0, max_pause=0)
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(retry_policy=policy, overload_pause=0, **kelvin_session_kwargs) as session:
+        assert await session.get("http://example.com/api") == {}
+    # the login POST is retried, although POST requests are not idempotent in general
+    assert len(token_requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_session_circuit_breaker_fails_fast(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        raise httpx.ConnectError("Connection refused")
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    breaker = CircuitBreaker(failure_threshold=3, cool_down=60)
+    policy = RetryPolicy(retries=5, min_pause=0, max_pause=0)
+    async with Session(
+        retry_policy=policy, circuit_breaker=breaker, **kelvin_session_kwargs
+    ) as session:
+        with pytest.raises(CircuitOpen):
+            await session.get("http://example.com/api")
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpen):
+            await session.get("http://example.com/api")
+    assert len(requests) == 3
+
+
+@pytest.mark.asyncio
+async def test_session_deadline_bounds_slow_request(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(**kelvin_session_kwargs) as session:
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded), deadline(0.2):
+            await session.get("http://example.com/api")
+        assert time.monotonic() - started < 1.0
+
+
+@pytest.mark.asyncio
+async def test_session_deadline_stops_retries(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(502)
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(retries=5, **kelvin_session_kwargs) as session:
+        started = time.monotonic()
+        with pytest.raises(ServerError), deadline(1.0):
+            await session.get("http://example.com/api")
+        # the minimum retry pause of 2s doesn't fit into the deadline
+        assert time.monotonic() - started < 0.5
+    assert len(requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_session_deadline_passed(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    mock_get = mocker.patch("httpx.AsyncClient.get")
+    async with Session(**kelvin_session_kwargs_mock) as session:
+        with pytest.raises(DeadlineExceeded), deadline(0):
+            await session.get("http://example.com/api")
+    mock_get.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_session_deadline_bounds_timeout(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    mock_response_200 = mocker.Mock(spec=httpx.Response)
+    mock_response_200.status_code = 200
+    mock_response_200.json.return_value = {}
+    mock_get = mocker.patch("httpx.AsyncClient.get", side_effect=make_async_mock(mock_response_200))
+    mock_get.__name__ = "get"
+    async with Session(**kelvin_session_kwargs_mock) as session:
+        with deadline(2):
+            await session.get("http://example.com/api")
+    assert mock_get.call_args[1]["timeout"] <= 2
+
+
+def school_create_transport(post_results: list, requests: list) -> httpx.MockTransport:
+    """
+    Results of POST requests are returned in order. Exceptions are raised after the school has
+    been created.
+    """
+    created = []
+    school_json = {
+        "name": "DEMO",
+        "dn": "ou=DEMO,dc=example,dc=com",
+        "url": "https://localhost/ucsschool/kelvin/v1/schools/DEMO",
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(f"{request.method} {request.url.path}")
+        if request.method == "POST":
+            created.append(True)
+            result = post_results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return httpx.Response(result, json=school_json)
+        if request.method == "HEAD":
+            return httpx.Response(200 if created else 404)
+        return httpx.Response(200, json=school_json)
+
+    return httpx.MockTransport(handler)
+
+
+@pytest.mark.asyncio
+async def test_save_adopts_object_created_by_failed_request(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+    transport = school_create_transport([httpx.ReadError("Connection reset")], requests)
+    policy = RetryPolicy(retries=2, min_pause=0, max_pause=0)
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=transport)
+    async with Session(retry_policy=policy, **kelvin_session_kwargs) as session:
+        school = await School(name="DEMO", session=session).save()
+    assert school.dn == "ou=DEMO,dc=example,dc=com"
+    assert requests == [
+        "POST /ucsschool/kelvin/v1/schools/",
+        "HEAD /ucsschool/kelvin/v1/schools/DEMO",
+        "GET /ucsschool/kelvin/v1/schools/DEMO",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_save_checks_existence_on_primary(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+    school_json = {"name": "DEMO", "dn": "ou=DEMO,dc=example,dc=com", "url": "u"}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(f"{request.method} {request.url.host}")
+        if request.method == "POST":
+            raise httpx.ReadError("Connection reset")
+        if request.url.host != "primary":
+            # not replicated yet
+            return httpx.Response(404)
+        return httpx.Response(200, json=school_json)
+
+    policy = RetryPolicy(retries=2, min_pause=0, max_pause=0)
+    kelvin_session_kwargs = dict(
+        kelvin_session_kwargs_mock,
+        host=["primary", "replica"],
+        transport=httpx.MockTransport(handler),
+    )
+    async with Session(retry_policy=policy, **kelvin_session_kwargs) as session:
+        school = await School(name="DEMO", session=session).save()
+    assert school.dn == "ou=DEMO,dc=example,dc=com"
+    assert requests == ["POST primary", "HEAD primary", "GET primary"]
+
+
+@pytest.mark.asyncio
+async def test_save_resends_create_if_object_does_not_exist(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+    created = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(f"{request.method} {request.url.path}")
+        if request.method == "POST" and not created:
+            created.append(False)
+            return httpx.Response(504)
+        if request.method == "HEAD":
+            return httpx.Response(404)
+        return httpx.Response(
+            201, json={"name": "DEMO", "dn": "ou=DEMO,dc=example,dc=com", "url": "u"}
+        )
+
+    policy = RetryPolicy(retries=2, min_pause=0, max_pause=0)
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(retry_policy=policy, **kelvin_session_kwargs) as session:
+        school = await School(name="DEMO", session=session).save()
+    assert school.dn == "ou=DEMO,dc=example,dc=com"
+    assert requests == [
+        "POST /ucsschool/kelvin/v1/schools/",
+        "HEAD /ucsschool/kelvin/v1/schools/DEMO",
+        "POST /ucsschool/kelvin/v1/schools/",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_save_does_not_retry_ambiguous_create_without_retries(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+    transport = school_create_transport([httpx.ReadError("Connection reset")], requests)
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=transport)
+    async with Session(**kelvin_session_kwargs) as session:
+        with pytest.raises(httpx.ReadError):
+            await School(name="DEMO", session=session).save()
+    assert requests == ["POST /ucsschool/kelvin/v1/schools/"]
+
+
+@pytest.mark.asyncio
+async def test_save_create_retry_stops_at_deadline(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+    transport = school_create_transport([httpx.ReadError("Connection reset")], requests)
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=transport)
+    async with Session(retry_policy=RetryPolicy(retries=2), **kelvin_session_kwargs) as session:
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded), deadline(0.3):
+            await School(name="DEMO", session=session).save()
+        # the minimum retry pause of 2s doesn't fit into the deadline
+        assert time.monotonic() - started < 0.3
+    assert requests == ["POST /ucsschool/kelvin/v1/schools/"]
+
+
+@pytest.mark.asyncio
+async def test_save_create_retry_spends_retry_budget(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(f"{request.method} {request.url.path}")
+        if request.method == "POST":
+            return httpx.Response(504)
+        return httpx.Response(404)
+
+    policy = RetryPolicy(retries=2, min_pause=0, max_pause=0)
+    budget = RetryBudget(ratio=0, min_retries=0)
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(
+        retry_policy=policy, retry_budget=budget, **kelvin_session_kwargs
+    ) as session:
+        with pytest.raises(ServerError):
+            await School(name="DEMO", session=session).save()
+    assert requests == [
+        "POST /ucsschool/kelvin/v1/schools/",
+        "HEAD /ucsschool/kelvin/v1/schools/DEMO",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_post_retries_only_safe_failures(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    responses = [httpx.Response(503), httpx.Response(502), httpx.Response(200, json={})]
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return responses.pop(0)
+
+    policy = RetryPolicy(retries=3, min_pause=0, max_pause=0)
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(retry_policy=policy, overload_pause=0, **kelvin_session_kwargs) as session:
+        with pytest.raises(ServerError):
+            await session.post("http://example.com/api", json={})
+    # 503 was retried, 502 was not
+    assert len(requests) == 2
@@ -25,14 +25,23 @@
 # /usr/share/common-licenses/AGPL-3; if not, see
 # <http://www.gnu.org/licenses/>.
 
+import asyncio
 import contextlib
 import copy
+import datetime
+import email.utils
+import gc
+import ssl
 import sys
+import time
+import uuid
 import warnings
 
 import httpx
+import jwt
 import pytest
 from async_property import async_property
+from conftest import make_token
 
 from ucsschool.kelvin.client import (
     Role,
@@ -46,7 +55,20 @@ from ucsschool.kelvin.client import (
     WorkGroup,
     WorkGroupResource,
 )
-from ucsschool.kelvin.client.session import BadSettingsWarning, Session
+from ucsschool.kelvin.client.exceptions import InvalidRequest, ServerError
+from ucsschool.kelvin.client.resilience import (
+    AdaptiveTimeouts,
+    HedgingPolicy,
+    TokenBucket,
+    deadline,
+)
+from ucsschool.kelvin.client.session import (
+    BadSettingsWarning,
+    Session,
+    Token,
+    _ssl_context,
+    clear_ssl_context_cache,
+)
 
 PY38 = sys.version_info >= (3, 8)
 
@@ -199,14 +221,793 @@ async def test_language_header_change_during_session(mocker, language, ObjectCla
     async with Session(**kelvin_session_kwargs, language="dummy_lang") as session:
         kelvin_obj: ObjectClass = ResourceClass(session=session, language=language)
         with contextlib.suppress(NotImplementedError):
-            await session.get("http://example.com")
+            await kelvin_obj.get_from_url("http://example.com")
         async_client_send_call_args = httpx.AsyncClient.send.call_args
         headers = async_client_send_call_args[0][0].headers
         if language:
             assert headers.get("accept-language")
             assert headers["accept-language"] == language
-            assert kelvin_obj.session.language == language
         else:
             assert headers.get("accept-language")
             assert headers["accept-language"] == "dummy_lang"
-            assert kelvin_obj.session.language == "dummy_lang"
+        # the language of the session is not changed
+        assert kelvin_obj.session.language == "dummy_lang"
+        with contextlib.suppress(NotImplementedError):
+            await session.get("http://example.com")
+        headers = httpx.AsyncClient.send.call_args[0][0].headers
+        assert headers["accept-language"] == "dummy_lang"
+
+
+@pytest.mark.asyncio
+async def test_language_per_request_concurrently():
+    languages = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.01)
+        languages.append(request.headers.get("accept-language"))
+        name = request.url.path.rsplit("/", 1)[-1]
+        return httpx.Response(200, json={"name": name, "dn": "", "url": str(request.url)})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(**kelvin_session_kwargs, language="en") as session:
+        session._token = Token.from_str(make_token(3600))
+        roles = await asyncio.gather(
+            *(
+                RoleResource(session=session, language=lang).get(name=lang or "default")
+                for lang in ("de", None, "fr") * 5
+            )
+        )
+        assert session.language == "en"
+        assert sorted(languages) == sorted(["de", "en", "fr"] * 5)
+        assert [role.language for role in roles[:3]] == ["de", None, "fr"]
+        languages.clear()
+        await roles[0].reload()
+        assert languages == ["de"]
+
+
+@pytest.mark.asyncio
+async def test_token_single_flight(fake_kelvin_api):
+    fake_kelvin_api.token_delay = 0.05
+    async with Session(**fake_kelvin_api.session_kwargs) as session:
+        headers = await asyncio.gather(*(session.json_headers for _ in range(200)))
+    assert len(fake_kelvin_api.token_requests) == 1
+    assert len({h["Authorization"] for h in headers}) == 1
+
+
+def test_token_lock_created_in_running_loop(fake_kelvin_api):
+    fake_kelvin_api.token_delay = 0.05
+    session = Session(**fake_kelvin_api.session_kwargs)
+    assert session._token_lock is None
+
+    async def fetch_tokens():
+        async with session:
+            return await asyncio.gather(*(session.token for _ in range(10)))
+
+    loop = asyncio.new_event_loop()
+    try:
+        tokens = loop.run_until_complete(fetch_tokens())
+    finally:
+        loop.close()
+    assert len(set(tokens)) == 1
+    assert len(fake_kelvin_api.token_requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_token_single_flight_after_expiry(fake_kelvin_api):
+    fake_kelvin_api.token_delay = 0.05
+    async with Session(**fake_kelvin_api.session_kwargs) as session:
+        await session.token
+        session._token.expiry = datetime.datetime.utcnow()
+        await asyncio.gather(*(session.json_headers for _ in range(50)))
+    assert len(fake_kelvin_api.token_requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_token_background_refresh(fake_kelvin_api):
+    async with Session(token_refresh_fraction=0.0001, **fake_kelvin_api.session_kwargs) as session:
+        first_token = await session.token
+        assert session._token_refresh_task
+        await asyncio.sleep(0.6)
+        assert len(fake_kelvin_api.token_requests) == 2
+        assert await session.token != first_token
+        refresh_task = session._token_refresh_task
+        assert refresh_task
+    assert refresh_task.cancelled()
+    assert session._token_refresh_task is None
+
+
+@pytest.mark.asyncio
+async def test_token_background_refresh_ignores_deadline_of_first_request(fake_kelvin_api):
+    async with Session(token_refresh_fraction=0.0001, **fake_kelvin_api.session_kwargs) as session:
+        with deadline(0.2):
+            first_token = await session.token
+        await asyncio.sleep(0.6)
+        assert len(fake_kelvin_api.token_requests) == 2
+        assert session._token.value != first_token
+        # and it is scheduled again
+        assert session._token_refresh_task
+
+
+@pytest.mark.asyncio
+async def test_token_background_refresh_disabled_by_default(fake_kelvin_api):
+    async with Session(**fake_kelvin_api.session_kwargs) as session:
+        await session.token
+        assert session._token_refresh_task is None
+
+
+@pytest.mark.parametrize("fraction", [0, 1, -0.5, 1.5])
+def test_token_refresh_fraction_invalid(fraction):
+    with pytest.raises(ValueError):
+        Session(token_refresh_fraction=fraction, **kelvin_session_kwargs_mock)
+
+
+@pytest.mark.asyncio
+async def test_session_limits_concurrent_requests(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    running = 0
+    max_running = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return httpx.Response(200, json={})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(max_client_tasks=5, **kelvin_session_kwargs) as session:
+        await asyncio.gather(*(session.get("http://example.com") for _ in range(50)))
+        assert session.queue_depth == 0
+    assert max_running == 5
+
+
+@pytest.mark.asyncio
+async def test_session_lowers_concurrency_limit_on_overload(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503)
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(max_client_tasks=8, **kelvin_session_kwargs) as session:
+        assert session.concurrency_limit == 8
+        with pytest.raises(ServerError):
+            await session.get("http://example.com")
+        assert session.concurrency_limit == 4
+
+
+@pytest.mark.asyncio
+async def test_session_http2():
+    pytest.importorskip("h2")
+    async with Session(http2=True, max_client_tasks=20, **kelvin_session_kwargs_mock) as session:
+        pool = session.client._transport._pool
+        assert pool._http2 is True
+        assert pool._max_connections == 20
+
+
+class H2Server:
+    """
+    HTTP/2 server without TLS ("h2c" with prior knowledge), that answers all requests with an
+    empty JSON object after `delay` seconds.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.connections = 0
+        self.requests = 0
+        self.max_concurrent_streams = 0
+        self._open_streams = 0
+
+    async def __aenter__(self) -> "H2Server":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.url = "http://127.0.0.1:{}/".format(self._server.sockets[0].getsockname()[1])
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        import h2.config
+        import h2.connection
+        import h2.events
+
+        self.connections += 1
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        responses = set()
+        while True:
+            data = await reader.read(65535)
+            if not data:
+                break
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    response = self._respond(conn, writer, event.stream_id)
+                    responses.add(asyncio.ensure_future(response))
+            writer.write(conn.data_to_send())
+        for response in responses:
+            response.cancel()
+        writer.close()
+
+    async def _respond(self, conn, writer: asyncio.StreamWriter, stream_id: int) -> None:
+        self.requests += 1
+        self._open_streams += 1
+        self.max_concurrent_streams = max(self.max_concurrent_streams, self._open_streams)
+        await asyncio.sleep(self.delay)
+        self._open_streams -= 1
+        conn.send_headers(
+            stream_id,
+            [(":status", "200"), ("content-type", "application/json"), ("content-length", "2")],
+        )
+        conn.send_data(stream_id, b"{}", end_stream=True)
+        writer.write(conn.data_to_send())
+
+
+@pytest.mark.asyncio
+async def test_session_http2_multiplexes_requests(mocker):
+    pytest.importorskip("h2")
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    async with H2Server(delay=0.1) as server:
+        # HTTP/2 without TLS requires prior knowledge, as there is no ALPN
+        async with Session(
+            http2=True, http1=False, max_client_tasks=20, **kelvin_session_kwargs_mock
+        ) as session:
+            started = time.monotonic()
+            results = await asyncio.gather(*(session.get(server.url) for _ in range(50)))
+            duration = time.monotonic() - started
+    assert results == 50 * [{}]
+    assert server.requests == 50
+    # all requests shared one connection, up to `max_client_tasks` at the same time
+    assert server.connections == 1
+    assert server.max_concurrent_streams == 20
+    # three rounds of 20, 20 and 10 concurrent requests
+    assert duration < 1.0
+
+
+@pytest.mark.asyncio
+async def test_session_http2_disabled_by_default():
+    async with Session(**kelvin_session_kwargs_mock) as session:
+        assert session.client._transport._pool._http2 is False
+
+
+@pytest.mark.asyncio
+async def test_session_connection_pool_limits():
+    async with Session(
+        max_client_tasks=12, keepalive_expiry=2.5, **kelvin_session_kwargs_mock
+    ) as session:
+        pool = session.client._transport._pool
+        assert pool._max_connections == 12
+        assert pool._max_keepalive_connections == 12
+        assert pool._keepalive_expiry == 2.5
+
+
+@pytest.mark.asyncio
+async def test_session_ssl_context_shared():
+    clear_ssl_context_cache()
+    async with Session(**kelvin_session_kwargs_mock) as session1:
+        async with Session(**kelvin_session_kwargs_mock) as session2:
+            ctx1 = session1.client._transport._pool._ssl_context
+            ctx2 = session2.client._transport._pool._ssl_context
+            assert ctx1 is ctx2
+        assert ctx1.verify_mode == ssl.CERT_NONE
+        async with Session(**{**kelvin_session_kwargs_mock, "verify": True}) as session3:
+            ctx3 = session3.client._transport._pool._ssl_context
+            assert ctx3 is not ctx1
+            assert ctx3.verify_mode == ssl.CERT_REQUIRED
+
+
+def test_ssl_context_creation_is_cached():
+    clear_ssl_context_cache()
+    t0 = time.perf_counter()
+    _ssl_context(True)
+    uncached = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for _ in range(100):
+        _ssl_context(True)
+    cached = (time.perf_counter() - t0) / 100
+    assert cached < uncached
+
+
+@pytest.mark.asyncio
+async def test_session_uds(tmp_path):
+    requests = []
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        head = await reader.readuntil(b"\r\n\r\n")
+        requests.append(head.decode())
+        body = b'{"name": "DEMOSCHOOL"}'
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            b"Content-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(body), body)
+        )
+        await writer.drain()
+        writer.close()
+
+    socket_path = str(tmp_path / "kelvin.sock")
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    try:
+        async with Session(uds=socket_path, **kelvin_session_kwargs_mock) as session:
+            session._token = Token.from_str(make_token(3600))
+            url = f"{session.urls['school']}DEMOSCHOOL"
+            assert url.startswith("https://localhost/")
+            assert await session.get(url) == {"name": "DEMOSCHOOL"}
+    finally:
+        server.close()
+        await server.wait_closed()
+    request_line, *headers = requests[0].splitlines()
+    assert request_line == "GET /ucsschool/kelvin/v1/schools/DEMOSCHOOL HTTP/1.1"
+    assert "Host: localhost" in headers
+
+
+@pytest.mark.asyncio
+async def test_session_routes_reads_to_replicas_and_writes_to_primary():
+    hosts = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append((request.method, request.url.host))
+        return httpx.Response(200, json={})
+
+    kwargs = {**kelvin_session_kwargs_mock, "host": ["primary", "replica1", "replica2"]}
+    async with Session(transport=httpx.MockTransport(handler), **kwargs) as session:
+        session._token = Token.from_str(make_token(3600))
+        assert session.host == "primary"
+        assert session.urls["user"].startswith("https://primary/")
+        for _ in range(4):
+            await session.get(f"{session.urls['user']}demo_student")
+        await session.post(session.urls["user"], json={})
+        await session.put("https://replica2/ucsschool/kelvin/v1/users/demo_student", json={})
+    assert sorted(hosts[:4]) == [("GET", "replica1")] * 2 + [("GET", "replica2")] * 2
+    assert hosts[4:] == [("POST", "primary"), ("PUT", "primary")]
+
+
+@pytest.mark.asyncio
+async def test_session_read_fails_over_on_connection_error():
+    hosts = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        if request.url.host == "replica1":
+            raise httpx.ConnectError("Connection refused", request=request)
+        return httpx.Response(200, json={"host": request.url.host})
+
+    kwargs = {**kelvin_session_kwargs_mock, "host": ["primary", "replica1"]}
+    async with Session(transport=httpx.MockTransport(handler), **kwargs) as session:
+        session._token = Token.from_str(make_token(3600))
+        assert await session.get(session.urls["user"]) == {"host": "primary"}
+        assert await session.get(session.urls["user"]) == {"host": "primary"}
+        assert not session.router.is_healthy("replica1")
+        assert session.router.outstanding("replica1") == 0
+    assert hosts == ["replica1", "primary", "primary"]
+
+
+@pytest.mark.asyncio
+async def test_session_recreates_client_after_fork(monkeypatch, fake_kelvin_api):
+    async with Session(**fake_kelvin_api.session_kwargs) as session:
+        await session.get("https://localhost/ucsschool/kelvin/v1/schools/")
+        parent_client = session.client
+        parent_limiter = session._client_task_limiter
+        token = session._token
+        monkeypatch.setattr("os.getpid", lambda: session._pid + 1)
+        await session.get("https://localhost/ucsschool/kelvin/v1/schools/")
+        assert session.client is not parent_client
+        assert session._client_task_limiter is not parent_limiter
+        assert session._token is token
+        # the parent's connections must not be closed by the child
+        assert not parent_client.is_closed
+    assert len(fake_kelvin_api.token_requests) == 1
+    await parent_client.aclose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "method,kwargs,resent",
+    [("get", {}, True), ("put", {"json": {}}, True), ("post", {"json": {}}, False)],
+)
+async def test_session_resend_on_stale_connection(mocker, method, kwargs, resent):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if len(requests) == 1:
+            raise httpx.RemoteProtocolError("Server disconnected without sending a response.")
+        return httpx.Response(200, json={})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(**kelvin_session_kwargs) as session:
+        if resent:
+            assert await getattr(session, method)("http://example.com", **kwargs) == {}
+        else:
+            with pytest.raises(httpx.RemoteProtocolError):
+                await getattr(session, method)("http://example.com", **kwargs)
+    assert len(requests) == (2 if resent else 1)
+
+
+@pytest.mark.asyncio
+async def test_session_holds_back_requests_on_overload(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(time.monotonic())
+        if len(requests) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0.3"})
+        return httpx.Response(200, json={})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(**kelvin_session_kwargs) as session:
+        with pytest.raises(InvalidRequest):
+            await session.get("http://example.com")
+        assert session.overload_pause_remaining > 0
+        await asyncio.gather(*(session.get("http://example.com") for _ in range(5)))
+    assert len(requests) == 6
+    assert all(ts - requests[0] >= 0.3 for ts in requests[1:])
+
+
+@pytest.mark.asyncio
+async def test_session_holds_back_queued_requests_on_overload(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+    paused_at = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(time.monotonic())
+        if len(requests) == 1:
+            # the other requests are queued by now
+            await asyncio.sleep(0.1)
+            paused_at.append(time.monotonic())
+            return httpx.Response(429, headers={"Retry-After": "0.5"})
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json={})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(max_client_tasks=4, **kelvin_session_kwargs) as session:
+        results = await asyncio.gather(
+            *(session.get("http://example.com") for _ in range(40)), return_exceptions=True
+        )
+    assert isinstance(results[0], InvalidRequest)
+    assert len(requests) == 40
+    # only the requests that were already sent, when the pause started, got through
+    during_pause = [ts for ts in requests if 0 < ts - paused_at[0] < 0.5]
+    assert len(during_pause) == 0
+
+
+@pytest.mark.asyncio
+async def test_session_rate_limits_per_method(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append((request.method, time.monotonic()))
+        return httpx.Response(200, json={})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    rate_limits = {"*": TokenBucket(rate=1000, burst=100), "post": TokenBucket(rate=20)}
+    async with Session(rate_limits=rate_limits, **kelvin_session_kwargs) as session:
+        started = time.monotonic()
+        await asyncio.gather(
+            *(session.post("http://example.com", json={}) for _ in range(5)),
+            *(session.get("http://example.com") for _ in range(20)),
+        )
+    get_times = [ts - started for method, ts in requests if method == "GET"]
+    post_times = [ts - started for method, ts in requests if method == "POST"]
+    assert len(get_times) == 20
+    assert max(get_times) < 0.1
+    assert len(post_times) == 5
+    assert max(post_times) >= 0.18
+
+
+@pytest.mark.asyncio
+async def test_session_rate_limit_does_not_hold_limiter_slots(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.method)
+        return httpx.Response(200, json={})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    rate_limits = {"POST": TokenBucket(rate=2)}
+    async with Session(
+        max_client_tasks=4, rate_limits=rate_limits, **kelvin_session_kwargs
+    ) as session:
+        posts = [
+            asyncio.ensure_future(session.post("http://example.com", json={})) for _ in range(8)
+        ]
+        await asyncio.sleep(0.01)
+        started = time.monotonic()
+        await session.get("http://example.com")
+        # the GET did not wait for POSTs sleeping in their bucket
+        assert time.monotonic() - started < 0.2
+        for post in posts:
+            post.cancel()
+        await asyncio.gather(*posts, return_exceptions=True)
+    assert requests.count("GET") == 1
+    assert requests.count("POST") < 8
+
+
+@pytest.mark.asyncio
+async def test_session_rate_limit_applies_to_queued_requests(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+    started = time.monotonic()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(time.monotonic())
+        if time.monotonic() - started < 0.5:
+            # requests queue up for a slot of the concurrency limiter
+            await asyncio.sleep(0.5)
+        return httpx.Response(200, json={})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    rate_limits = {"*": TokenBucket(rate=10, burst=1)}
+    async with Session(
+        max_client_tasks=4, rate_limits=rate_limits, **kelvin_session_kwargs
+    ) as session:
+        await asyncio.gather(*(session.get("http://example.com") for _ in range(14)))
+    assert len(requests) == 14
+    # at 10 requests per second, no more than 3 requests are sent within 200 ms
+    assert max(sum(1 for ts in requests if 0 <= ts - t0 < 0.2) for t0 in requests) <= 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method,hedged", [("get", True), ("head", True), ("post", False)])
+async def test_session_hedged_requests(mocker, method, hedged):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    requests = []
+    cancelled = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        try:
+            # the first request is stuck
+            await asyncio.sleep(1.0 if len(requests) == 1 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(request)
+            raise
+        return httpx.Response(200, json={"request": len(requests)})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    hedging = HedgingPolicy(initial_delay=0.1)
+    async with Session(hedging=hedging, **kelvin_session_kwargs) as session:
+        started = time.monotonic()
+        kwargs = {"json": {}} if method == "post" else {}
+        await getattr(session, method)("http://example.com", **kwargs)
+        elapsed = time.monotonic() - started
+        assert session.concurrency_limit == session.max_client_tasks
+    if hedged:
+        assert elapsed < 0.5
+        assert len(requests) == 2
+        assert len(cancelled) == 1
+        assert hedging.fired == 1
+        assert hedging.won == 1
+    else:
+        assert elapsed >= 1.0
+        assert len(requests) == 1
+        assert hedging.fired == 0
+
+
+@pytest.mark.asyncio
+async def test_session_hedging_not_fired_for_fast_requests(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    hedging = HedgingPolicy(initial_delay=0.1, min_samples=5)
+    async with Session(hedging=hedging, **kelvin_session_kwargs) as session:
+        await asyncio.gather(*(session.get("http://example.com") for _ in range(10)))
+    assert hedging.fired == 0
+    assert hedging.delay("GET", "http://example.com") == hedging.min_delay
+
+
+@pytest.mark.asyncio
+async def test_session_hedging_retrieves_exception_of_unused_request(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    hedged = asyncio.Event()
+    errors = []
+    loop = asyncio.get_event_loop()
+    loop.set_exception_handler(lambda loop, context: errors.append(context))
+
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if len(requests) == 1:
+            await hedged.wait()
+            return httpx.Response(200, json={})
+        # the hedged request fails at the same time, the original one succeeds
+        hedged.set()
+        await asyncio.sleep(0)
+        raise httpx.ConnectError("Connection refused", request=request)
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    hedging = HedgingPolicy(initial_delay=0.05)
+    try:
+        async with Session(hedging=hedging, **kelvin_session_kwargs) as session:
+            assert await session.get("http://example.com") == {}
+        assert hedging.fired == 1
+        gc.collect()
+        await asyncio.sleep(0)
+    finally:
+        loop.set_exception_handler(None)
+    assert errors == []
+
+
+@pytest.mark.asyncio
+async def test_session_default_timeout_argument(mocker):
+    mocker.patch("httpx.AsyncClient.post", side_effect=NotImplementedError)
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, timeout=5)
+    async with Session(**kelvin_session_kwargs) as session:
+        with contextlib.suppress(NotImplementedError):
+            await session.post("http://example.com", json={}, default_timeout=30.0)
+        assert call_kwargs(session.client.post.call_args)["timeout"] == 30.0
+
+
+@pytest.mark.asyncio
+async def test_session_adaptive_timeouts(mocker):
+    mocker.patch("ucsschool.kelvin.client.session.Session.token", SessionMock.token)
+    timeouts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        timeouts.append(request.extensions["timeout"]["read"])
+        return httpx.Response(200, json={})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    adaptive_timeouts = AdaptiveTimeouts(floor=0.5, min_samples=5)
+    async with Session(adaptive_timeouts=adaptive_timeouts, **kelvin_session_kwargs) as session:
+        for _ in range(6):
+            await session.get("http://example.com/ucsschool/kelvin/v1/roles/student")
+        await session.get("http://example.com/ucsschool/kelvin/v1/roles/student", timeout=3)
+        await session.get("http://example.com/ucsschool/kelvin/v1/users/demo")
+    # static timeout until enough latencies were recorded
+    assert timeouts[:5] == [10.0] * 5
+    assert timeouts[5] == 0.5
+    # explicit timeouts win
+    assert timeouts[6] == 3
+    # other endpoints have their own latencies
+    assert timeouts[7] == 10.0
+
+
+@pytest.mark.asyncio
+async def test_session_reauthenticates_on_401(fake_kelvin_api):
+    issued_tokens = fake_kelvin_api.issued_tokens
+    resource_requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        resource_requests.append(request)
+        # the first token was invalidated on the server
+        if request.headers["Authorization"] == f"Bearer {issued_tokens[0]}":
+            return httpx.Response(401, json={"detail": "Could not validate credentials"})
+        return httpx.Response(200, json={"ok": True})
+
+    fake_kelvin_api.handler = handler
+    fake_kelvin_api.token_delay = 0.01
+    async with Session(**fake_kelvin_api.session_kwargs) as session:
+        results = await asyncio.gather(
+            *(session.get("http://example.com/ucsschool/kelvin/v1/users/") for _ in range(20))
+        )
+    assert results == 20 * [{"ok": True}]
+    assert len(issued_tokens) == 2
+    assert len(resource_requests) == 40
+
+
+@pytest.mark.asyncio
+async def test_session_reauthenticates_on_401_after_token_was_replaced(fake_kelvin_api):
+    issued_tokens = fake_kelvin_api.issued_tokens
+    resource_requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        resource_requests.append(request)
+        if request.headers["Authorization"] == f"Bearer {issued_tokens[0]}":
+            # the second request is answered after the first one got a new token
+            await asyncio.sleep(0.2 * (len(resource_requests) - 1))
+            return httpx.Response(401, json={"detail": "Could not validate credentials"})
+        return httpx.Response(200, json={"ok": True})
+
+    fake_kelvin_api.handler = handler
+    async with Session(**fake_kelvin_api.session_kwargs) as session:
+        await session.token
+        results = await asyncio.gather(
+            *(session.get("http://example.com/ucsschool/kelvin/v1/users/") for _ in range(2))
+        )
+    assert results == 2 * [{"ok": True}]
+    assert len(issued_tokens) == 2
+    assert len(resource_requests) == 4
+
+
+@pytest.mark.asyncio
+async def test_session_reauthenticates_only_once(fake_kelvin_api):
+    resource_requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        resource_requests.append(request)
+        return httpx.Response(401, json={"detail": "Not authorized"})
+
+    fake_kelvin_api.handler = handler
+    async with Session(**fake_kelvin_api.session_kwargs) as session:
+        with pytest.raises(InvalidRequest) as exc_info:
+            await session.get("http://example.com/ucsschool/kelvin/v1/users/")
+    assert exc_info.value.status == 401
+    assert len(fake_kelvin_api.token_requests) == 2
+    assert len(resource_requests) == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("clock_offset", [-3590, 0, 7200])
+async def test_token_expiry_with_clock_skew(clock_offset):
+    token_requests = []
+    server_now = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+        seconds=clock_offset
+    )
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/token"):
+            token_requests.append(request)
+            expiry = server_now + datetime.timedelta(seconds=3600)
+            token = jwt.encode({"exp": expiry, "jti": uuid.uuid4().hex}, "s3cr3t")
+            return httpx.Response(
+                200,
+                json={"access_token": token},
+                headers={"Date": email.utils.format_datetime(server_now, usegmt=True)},
+            )
+        return httpx.Response(200, json={})
+
+    kelvin_session_kwargs = dict(kelvin_session_kwargs_mock, transport=httpx.MockTransport(handler))
+    async with Session(**kelvin_session_kwargs) as session:
+        for _ in range(5):
+            await session.token
+        assert abs(session._clock_offset.total_seconds() - clock_offset) <= 2
+    assert len(token_requests) == 1
+
+
+def test_token_is_valid_with_clock_offset():
+    # token expired 10 seconds ago on the server, whose clock is two hours ahead
+    expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=2, seconds=-10)
+    token = Token(expiry=expiry, value="token")
+    assert token.is_valid()
+    assert not token.is_valid(datetime.timedelta(hours=2))
+    assert token.seconds_left(datetime.timedelta(hours=2)) < 0
+
+
+@pytest.mark.asyncio
+async def test_session_token_provider():
+    provided_tokens = []
+    resource_requests = []
+
+    async def token_provider() -> str:
+        provided_tokens.append(make_token())
+        return provided_tokens[-1]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert not request.url.path.endswith("/token")
+        resource_requests.append(request)
+        return httpx.Response(200, json={})
+
+    transport = httpx.MockTransport(handler)
+    for _ in range(2):
+        async with Session(
+            host="localhost", token_provider=token_provider, transport=transport
+        ) as session:
+            await asyncio.gather(*(session.get("http://example.com") for _ in range(5)))
+    assert len(provided_tokens) == 2
+    assert resource_requests[0].headers["Authorization"] == f"Bearer {provided_tokens[0]}"
+    assert resource_requests[-1].headers["Authorization"] == f"Bearer {provided_tokens[1]}"
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"username": "u", "password": "p"},
+        {"username": "u", "host": "localhost"},
+        {"password": "p", "host": "localhost"},
+    ],
+)
+def test_session_missing_arguments(kwargs):
+    with pytest.raises(TypeError):
+        Session(**kwargs)
@@ -0,0 +1,166 @@
+# Copyright 2026 Univention GmbH
+#
+# http://www.univention.de/
+#
+# All rights reserved.
+#
+# The source code of this program is made available
+# under the terms of the GNU Affero General Public License version 3
+# (GNU AGPL V3) as published by the Free Software Foundation.
+#
+# Binary versions of this program provided by Univention to you as
+# well as other copyrighted, protected or trademarked materials like
+# Logos, graphics, fonts, specific documentations and configurations,
+# cryptographic keys etc. are subject to a license agreement between
+# you and Univention and not subject to the GNU AGPL V3.
+#
+# In the case you use this program under the terms of the GNU AGPL V3,
+# the program is provided in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License with the Debian GNU/Linux or Univention distribution in file
+# /usr/share/common-licenses/AGPL-3; if not, see
+# <http://www.gnu.org/licenses/>.
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+
+import httpx
+import pytest
+
+from ucsschool.kelvin.client import (
+    SchoolClass,
+    SyncKelvinObject,
+    SyncSchoolClassResource,
+    SyncSession,
+)
+
+HOST = "localhost"
+CLASS_URL = f"https://{HOST}/ucsschool/kelvin/v1/classes/"
+SCHOOL_URL = f"https://{HOST}/ucsschool/kelvin/v1/schools/"
+
+
+def school_class_json(name: str, description: str = None) -> dict:
+    return {
+        "name": name,
+        "school": f"{SCHOOL_URL}DEMOSCHOOL",
+        "description": description,
+        "users": [],
+        "ucsschool_roles": [],
+        "udm_properties": {},
+        "dn": f"cn=DEMOSCHOOL-{name},cn=klassen,ou=DEMOSCHOOL",
+        "url": f"{CLASS_URL}DEMOSCHOOL/{name}",
+    }
+
+
+@pytest.fixture
+def kelvin_api(fake_kelvin_api):
+    def handler(request: httpx.Request) -> httpx.Response:
+        name = request.url.path.rsplit("/", 1)[-1]
+        if request.method == "HEAD":
+            return httpx.Response(200 if name == "5a" else 404)
+        if request.method == "PUT":
+            return httpx.Response(200, content=request.content)
+        if request.method == "POST":
+            data = httpx.Response(200, content=request.content).json()
+            return httpx.Response(201, json=school_class_json(data["name"], data["description"]))
+        if name:
+            return httpx.Response(200, json=school_class_json(name))
+        return httpx.Response(200, json=[school_class_json("5a"), school_class_json("5b")])
+
+    fake_kelvin_api.host = HOST
+    fake_kelvin_api.handler = handler
+    return fake_kelvin_api
+
+
+def test_sync_session_resource_operations(kelvin_api):
+    with SyncSession(**kelvin_api.session_kwargs) as kelvin:
+        resource = SyncSchoolClassResource(kelvin)
+        school_class = resource.get(school="DEMOSCHOOL", name="5a")
+        assert isinstance(school_class, SyncKelvinObject)
+        assert school_class.name == "5a"
+        assert school_class.school == "DEMOSCHOOL"
+        school_class.description = "changed"
+        assert school_class.obj.description == "changed"
+        assert school_class.save() is school_class
+        assert school_class.description == "changed"
+        assert [sc.name for sc in resource.search(school="DEMOSCHOOL")] == ["5a", "5b"]
+        assert resource.exists(school="DEMOSCHOOL", name="5a") is True
+        assert resource.exists(school="DEMOSCHOOL", name="5c") is False
+    assert kelvin.closed
+    # one token for all requests
+    assert len(kelvin_api.token_requests) == 1
+
+
+def test_sync_session_create_object(kelvin_api):
+    with SyncSession(**kelvin_api.session_kwargs) as kelvin:
+        school_class = SyncKelvinObject(
+            SchoolClass(name="6a", school="DEMOSCHOOL", description="new", users=[]), kelvin
+        )
+        school_class.save()
+        assert school_class.url == f"{CLASS_URL}DEMOSCHOOL/6a"
+    assert kelvin_api.requests[-1].method == "POST"
+
+
+def test_sync_session_runs_in_one_background_thread(kelvin_api):
+    with SyncSession(**kelvin_api.session_kwargs) as kelvin:
+        client = kelvin.session.client
+
+        async def thread_name() -> str:
+            return threading.current_thread().name
+
+        assert kelvin.run(thread_name()) == "kelvin-client-loop"
+        SyncSchoolClassResource(kelvin).get(school="DEMOSCHOOL", name="5a")
+        assert kelvin.session.client is client
+    with pytest.raises(RuntimeError):
+        kelvin.run(thread_name())
+    kelvin.close()
+
+
+def test_sync_session_run_cancels_on_timeout(kelvin_api):
+    cancelled = threading.Event()
+
+    async def slow() -> None:
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with SyncSession(**kelvin_api.session_kwargs) as kelvin:
+        with pytest.raises(concurrent.futures.TimeoutError):
+            kelvin.run(slow(), timeout=0.1)
+        assert cancelled.wait(1)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork()")
+def test_sync_session_after_fork(kelvin_api):
+    with SyncSession(**kelvin_api.session_kwargs) as kelvin:
+        SyncSchoolClassResource(kelvin).get(school="DEMOSCHOOL", name="5a")
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            try:
+                SyncSchoolClassResource(kelvin).get(school="DEMOSCHOOL", name="5b")
+                os._exit(0 if len(kelvin_api.token_requests) == 1 else 2)
+            except BaseException:
+                os._exit(1)
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+        # the parent still works
+        SyncSchoolClassResource(kelvin).get(school="DEMOSCHOOL", name="5c")
+
+
+def test_sync_session_stops_loop_on_error():
+    def loop_threads() -> int:
+        return sum(1 for t in threading.enumerate() if t.name == "kelvin-client-loop")
+
+    threads = loop_threads()
+    for _ in range(3):
+        with pytest.raises(TypeError):
+            SyncSession(host=None)
+    assert loop_threads() == threads
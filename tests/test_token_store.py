@@ -0,0 +1,126 @@
+# Copyright 2026 Univention GmbH
+#
+# http://www.univention.de/
+#
+# All rights reserved.
+#
+# The source code of this program is made available
+# under the terms of the GNU Affero General Public License version 3
+# (GNU AGPL V3) as published by the Free Software Foundation.
+#
+# Binary versions of this program provided by Univention to you as
+# well as other copyrighted, protected or trademarked materials like
+# Logos, graphics, fonts, specific documentations and configurations,
+# cryptographic keys etc. are subject to a license agreement between
+# you and Univention and not subject to the GNU AGPL V3.
+#
+# In the case you use this program under the terms of the GNU AGPL V3,
+# the program is provided in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License with the Debian GNU/Linux or Univention distribution in file
+# /usr/share/common-licenses/AGPL-3; if not, see
+# <http://www.gnu.org/licenses/>.
+
+import asyncio
+import multiprocessing
+import stat
+
+import pytest
+from conftest import make_token
+
+from ucsschool.kelvin.client import FileTokenStore, Session
+
+
+def _store_tokens(path: str, worker: int) -> None:
+    store = FileTokenStore(path)
+    for i in range(20):
+        store.set(f"user{worker}@host{i}", f"token{worker}-{i}")
+
+
+def test_file_token_store_roundtrip(tmp_path):
+    path = tmp_path / "sub" / "tokens.json"
+    store = FileTokenStore(path)
+    assert store.get("username@localhost") is None
+    store.set("username@localhost", "abc")
+    store.set("other@localhost", "def")
+    assert FileTokenStore(path).get("username@localhost") == "abc"
+    assert FileTokenStore(path).get("other@localhost") == "def"
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+
+
+def test_file_token_store_corrupt_file(tmp_path):
+    path = tmp_path / "tokens.json"
+    path.write_text("not json")
+    store = FileTokenStore(path)
+    assert store.get("username@localhost") is None
+    store.set("username@localhost", "abc")
+    assert store.get("username@localhost") == "abc"
+
+
+def test_file_token_store_concurrent_processes(tmp_path):
+    path = str(tmp_path / "tokens.json")
+    procs = [multiprocessing.Process(target=_store_tokens, args=(path, w)) for w in range(4)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    store = FileTokenStore(path)
+    for worker in range(4):
+        for i in range(20):
+            assert store.get(f"user{worker}@host{i}") == f"token{worker}-{i}"
+
+
+@pytest.mark.asyncio
+async def test_session_stores_and_reuses_token(tmp_path, fake_kelvin_api):
+    store = FileTokenStore(tmp_path / "tokens.json")
+    kelvin_session_kwargs = fake_kelvin_api.session_kwargs
+    async with Session(token_store=store, **kelvin_session_kwargs) as session:
+        token = await session.token
+    assert len(fake_kelvin_api.token_requests) == 1
+    assert store.get("username@localhost") == token
+    async with Session(token_store=store, **kelvin_session_kwargs) as session:
+        assert await session.token == token
+    assert len(fake_kelvin_api.token_requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_session_schedules_refresh_of_stored_token(tmp_path, fake_kelvin_api):
+    store = FileTokenStore(tmp_path / "tokens.json")
+    stored_token = make_token()
+    store.set("username@localhost", stored_token)
+    kelvin_session_kwargs = fake_kelvin_api.session_kwargs
+    async with Session(
+        token_store=store, token_refresh_fraction=0.0001, **kelvin_session_kwargs
+    ) as session:
+        assert await session.token == stored_token
+        assert session._token_refresh_task
+        await asyncio.sleep(0.6)
+        assert len(fake_kelvin_api.token_requests) == 1
+        assert session._token.value != stored_token
+
+
+@pytest.mark.asyncio
+async def test_session_ignores_expired_stored_token(tmp_path, fake_kelvin_api):
+    store = FileTokenStore(tmp_path / "tokens.json")
+    expired_token = make_token(lifetime=-10)
+    store.set("username@localhost", expired_token)
+    kelvin_session_kwargs = fake_kelvin_api.session_kwargs
+    async with Session(token_store=store, **kelvin_session_kwargs) as session:
+        token = await session.token
+    assert token != expired_token
+    assert len(fake_kelvin_api.token_requests) == 1
+    assert store.get("username@localhost") == token
+
+
+@pytest.mark.asyncio
+async def test_session_ignores_broken_stored_token(tmp_path, fake_kelvin_api):
+    store = FileTokenStore(tmp_path / "tokens.json")
+    store.set("username@localhost", "broken")
+    kelvin_session_kwargs = fake_kelvin_api.session_kwargs
+    async with Session(token_store=store, **kelvin_session_kwargs) as session:
+        await asyncio.gather(session.token, session.token)
+    assert len(fake_kelvin_api.token_requests) == 1
@@ -10,20 +10,51 @@ except ImportError:  # pragma: no cover
 
 from .base import KelvinObject, KelvinResource
 from .exceptions import (
+    CircuitOpen,
+    DeadlineExceeded,
     InvalidRequest,
     InvalidToken,
     KelvinClientError,
     NoObject,
     ServerError,
 )
+from .pool import SessionPool, SessionPoolStats
+from .resilience import (
+    AdaptiveTimeouts,
+    CircuitBreaker,
+    HedgingPolicy,
+    HostRouter,
+    RetryBudget,
+    RetryPolicy,
+    TokenBucket,
+    deadline,
+)
 from .role import Role, RoleResource
 from .school import School, SchoolResource
 from .school_class import SchoolClass, SchoolClassResource
 from .session import Session
+from .sync import (
+    SyncKelvinObject,
+    SyncKelvinResource,
+    SyncRoleResource,
+    SyncSchoolClassResource,
+    SyncSchoolResource,
+    SyncSession,
+    SyncUserResource,
+    SyncWorkGroupResource,
+)
+from .token_store import FileTokenStore, TokenStore
 from .user import PasswordsHashes, User, UserResource
 from .workgroup import WorkGroup, WorkGroupResource
 
 __all__ = [
+    "AdaptiveTimeouts",
+    "CircuitBreaker",
+    "CircuitOpen",
+    "DeadlineExceeded",
+    "FileTokenStore",
+    "HedgingPolicy",
+    "HostRouter",
     "KelvinObject",
     "KelvinResource",
     "InvalidRequest",
@@ -31,18 +62,33 @@ __all__ = [
     "KelvinClientError",
     "NoObject",
     "PasswordsHashes",
+    "RetryBudget",
+    "RetryPolicy",
     "ServerError",
     "School",
     "SchoolResource",
     "SchoolClass",
     "SchoolClassResource",
     "Session",
+    "SessionPool",
+    "SessionPoolStats",
+    "SyncKelvinObject",
+    "SyncKelvinResource",
+    "SyncRoleResource",
+    "SyncSchoolClassResource",
+    "SyncSchoolResource",
+    "SyncSession",
+    "SyncUserResource",
+    "SyncWorkGroupResource",
     "Role",
     "RoleResource",
+    "TokenBucket",
+    "TokenStore",
     "User",
     "UserResource",
     "WorkGroup",
     "WorkGroupResource",
+    "deadline",
 ]
 
 
@@ -25,15 +25,21 @@
 # License with the Debian GNU/Linux or Univention distribution in file
 # /usr/share/common-licenses/AGPL-3; if not, see
 # <http://www.gnu.org/licenses/>.
+import asyncio
 import copy
 import logging
 from typing import Any, AsyncIterator, Dict, Iterable, List, TypeVar
 from urllib.parse import unquote
 
-from .exceptions import InvalidRequest, NoObject
+import httpx
+
+from .exceptions import DeadlineExceeded, InvalidRequest, NoObject, ServerError
+from .resilience import SAFE_RETRY_EXCEPTIONS, deadline_remaining
 from .session import Session
 
 KelvinObjectType = TypeVar("KelvinObjectType", bound="KelvinObject")
+# the request may or may not have reached the Kelvin API
+AMBIGUOUS_STATUS_CODES = (httpx.codes.BAD_GATEWAY, httpx.codes.GATEWAY_TIMEOUT)
 
 logger = logging.getLogger(__name__)
 
@@ -60,8 +66,8 @@ class KelvinObject:
         self.dn = dn
         self.url = url
         self.session = session
-        if language:
-            self.session.language = language
+        # Accept-Language for requests of this object, overriding the Session's language
+        self.language = language
         self._resource_class = KelvinResource
         self._fresh = True
         self._deleted = False
@@ -88,7 +94,9 @@ class KelvinObject:
                 self._class_display_name,
                 self,
             )
-        obj = await self._resource_class(session=self.session).get(**self._required_get_attrs)
+        obj = await self._resource_class(session=self.session, language=self.language).get(
+            **self._required_get_attrs
+        )
         for k, v in obj.as_dict().items():
             setattr(self, k, v)
         self._update_old_attrs()
@@ -112,11 +120,7 @@ class KelvinObject:
         # assumption: if self.url was set, the object exists in the Kelvin API
         # so if it's not set, we'll try to create the object
         if not self.url:
-            resp_json = await self.session.post(
-                url=self._resource_class(session=self.session).collection_url,
-                json=data,
-                timeout=30.0,
-            )
+            resp_json = await self._create(data)
             resp_obj = self._from_kelvin_response(resp_json)
             for k, v in resp_obj.as_dict().items():
                 setattr(self, k, v)
@@ -124,20 +128,83 @@ class KelvinObject:
             return self
         # self.url was set -> modify object
         # TODO: or creation failed and this is the fall-back
-        resp_json = await self.session.put(url=self.url, json=data)
+        resp_json = await self.session.put(url=self.url, json=data, language=self.language)
         resp_obj = self._from_kelvin_response(resp_json)
         for k, v in resp_obj.as_dict().items():
             setattr(self, k, v)
         self._fresh = False
         return self
 
+    async def _create(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Create the object in the Kelvin API.
+
+        If the request failed in a way that leaves open, whether the server created the object
+        (e.g. a lost connection or a gateway timeout), it is only resent (up to the number of
+        retries of the session), after checking that the object does not exist. If it does, it
+        is adopted. Like other retries, resending pauses with jitter, spends the retry budget of
+        the session and must fit into the current deadline.
+        """
+        resource = self._resource_class(session=self.session, language=self.language)
+        retry_policy = self.session.retry_policy
+        pause = None
+        for attempt in range(retry_policy.retries + 1):
+            try:
+                return await self.session.post(
+                    url=resource.collection_url,
+                    json=data,
+                    default_timeout=30.0,
+                    language=self.language,
+                )
+            except (httpx.TransportError, ServerError) as exc:
+                ambiguous = (
+                    exc.status in AMBIGUOUS_STATUS_CODES
+                    if isinstance(exc, ServerError)
+                    else not isinstance(exc, SAFE_RETRY_EXCEPTIONS)
+                )
+                if not ambiguous or attempt >= retry_policy.retries:
+                    raise
+                pause = retry_policy.pause(pause)
+                remaining = deadline_remaining()
+                if remaining is not None and pause >= remaining:
+                    raise DeadlineExceeded(
+                        f"Deadline exceeded before retrying to create {self._class_display_name} "
+                        f"{self}.",
+                        url=resource.collection_url,
+                    ) from exc
+                logger.warning(
+                    "[%s] Creating %s %s failed (%s), checking if it exists before retrying...",
+                    self.session.request_id[:10],
+                    self._class_display_name,
+                    self,
+                    exc,
+                )
+                error = exc
+            await asyncio.sleep(pause)
+            # ask the primary, a replica may not have the new object yet
+            if await resource._exists(self._required_get_attrs, primary=True):
+                logger.info(
+                    "[%s] %s %s was created by the failed request.",
+                    self.session.request_id[:10],
+                    self._class_display_name,
+                    self,
+                )
+                return await self.session.get(
+                    resource.object_url.format(**self._required_get_attrs),
+                    language=self.language,
+                    primary=True,
+                )
+            if not self.session.retry_budget.try_spend():
+                logger.warning("Retry budget exhausted, not retrying.")
+                raise error
+
     async def delete(self) -> None:
         if self._deleted:
             logger.warning("[%s] %s has already been deleted.", self.session.request_id[:10], self)
             return
         if not self.url:
             raise RuntimeError("Attribute 'url' unset. Run 'reload()' before 'delete()'.")
-        await self.session.delete(self.url)
+        await self.session.delete(self.url, language=self.language)
         self._deleted = True
 
     def as_dict(self) -> Dict[str, Any]:
@@ -194,8 +261,8 @@ class KelvinResource:
 
     def __init__(self, session: Session, language: str = None):
         self.session = session
-        if language:
-            self.session.language = language
+        # Accept-Language for requests of this resource, overriding the Session's language
+        self.language = language
         self.collection_url = ""
         self.object_url = ""
 
@@ -218,13 +285,19 @@ class KelvinResource:
             ) from exc
 
     async def exists(self, **kwargs) -> bool:
+        return await self._exists(kwargs)
+
+    async def _exists(self, kwargs: Dict[str, Any], primary: bool = False) -> bool:
+        """
+        :param bool primary: ask the primary host, instead of a replica
+        """
         if not all(attr in kwargs for attr in self.Meta.required_head_attrs):
             raise AssertionError(
                 f"{self.__class__.__name__}.get() requires argument(s): "
                 f"{', '.join(self.Meta.required_get_attrs)}."
             )
         url = self.object_url.format(**kwargs)
-        status_code: int = await self.session.head(url)
+        status_code: int = await self.session.head(url, language=self.language, primary=primary)
         if status_code == 200:
             return True
         if status_code == 404:
@@ -235,15 +308,16 @@ class KelvinResource:
             status_code,
         )
         try:
-            await self.get(**kwargs)
+            await self.session.get(url, language=self.language, primary=primary)
         except NoObject:
             return False
         return True
 
     async def get_from_url(self, url: str) -> KelvinObjectType:
-        resp_json: Dict[str, Any] = await self.session.get(url)
+        resp_json: Dict[str, Any] = await self.session.get(url, language=self.language)
         obj = self.Meta.kelvin_object._from_kelvin_response(resp_json)
         obj.session = self.session
+        obj.language = self.language
         return obj
 
     async def search(self, **kwargs) -> AsyncIterator[KelvinObjectType]:
@@ -251,10 +325,13 @@ class KelvinResource:
         # not necessary, but will simplify the query string
         for k in [k for k, v in kwargs.items() if v in ("", "*")]:
             del kwargs[k]
-        resp_json: List[Dict[str, Any]] = await self.session.get(self.collection_url, params=kwargs)
+        resp_json: List[Dict[str, Any]] = await self.session.get(
+            self.collection_url, params=kwargs, language=self.language
+        )
         for resp in resp_json:
             obj = self.Meta.kelvin_object._from_kelvin_response(resp)
             obj.session = self.session
+            obj.language = self.language
             yield obj
 
     def _check_search_attrs(self, **kwargs) -> None:
@@ -36,6 +36,12 @@ class KelvinClientError(Exception):
         super().__init__(msg)
 
 
+class CircuitOpen(KelvinClientError): ...
+
+
+class DeadlineExceeded(KelvinClientError): ...
+
+
 class InvalidRequest(KelvinClientError): ...
 
 
@@ -0,0 +1,167 @@
+#
+# Copyright 2026 Univention GmbH
+#
+# http://www.univention.de/
+#
+# All rights reserved.
+#
+# The source code of this program is made available
+# under the terms of the GNU Affero General Public License version 3
+# (GNU AGPL V3) as published by the Free Software Foundation.
+#
+# Binary versions of this program provided by Univention to you as
+# well as other copyrighted, protected or trademarked materials like
+# Logos, graphics, fonts, specific documentations and configurations,
+# cryptographic keys etc. are subject to a license agreement between
+# you and Univention and not subject to the GNU AGPL V3.
+#
+# In the case you use this program under the terms of the GNU AGPL V3,
+# the program is provided in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License with the Debian GNU/Linux or Univention distribution in file
+# /usr/share/common-licenses/AGPL-3; if not, see
+# <http://www.gnu.org/licenses/>.
+import asyncio
+import collections
+import contextlib
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from .session import Session
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SessionPoolStats:
+    sessions: int  # known sessions, open or closed (with their tokens)
+    open: int  # sessions with an open HTTP client
+    in_use: int  # sessions currently used by a task
+    hits: int  # requests for a session that was open
+    misses: int  # requests for a session that had to be opened
+    evictions: int  # sessions closed to make room for another one
+
+
+class SessionPool:
+    """
+    Sessions for many Kelvin APIs, e.g. of different UCS\\@school domains.
+
+    At most `max_open` sessions have an open HTTP client (and connections) at a time. To open
+    another one, the least recently used session that is not in use, is closed. Closed sessions
+    keep their token, so reopening them does not require a new login, while it is valid.
+
+    :param int max_open: maximum number of open sessions
+    :param session_kwargs: arguments for all `Session` objects (e.g. ``retries``)
+    """
+
+    def __init__(self, max_open: int = 20, **session_kwargs):
+        if max_open < 1:
+            raise ValueError("Value of 'max_open' must be positive.")
+        self.max_open = max_open
+        self.session_kwargs = session_kwargs
+        # least recently used first
+        self._sessions: collections.OrderedDict[Tuple[str, str], Session] = (
+            collections.OrderedDict()
+        )
+        self._in_use: Dict[Tuple[str, str], int] = collections.defaultdict(int)
+        # created on first use, see `_get_condition()`
+        self._condition: Optional[asyncio.Condition] = None
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    async def __aenter__(self) -> "SessionPool":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def stats(self) -> SessionPoolStats:
+        return SessionPoolStats(
+            sessions=len(self._sessions),
+            open=self._open_count,
+            in_use=sum(1 for count in self._in_use.values() if count),
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+        )
+
+    @property
+    def _open_count(self) -> int:
+        return sum(1 for session in self._sessions.values() if session._client)
+
+    @contextlib.asynccontextmanager
+    async def session(
+        self, host: str, username: str, password: str, **kwargs
+    ) -> AsyncIterator[Session]:
+        """
+        Use the open session for `host` and `username`, opening it if necessary. Waits, if
+        `max_open` sessions are open and all of them are in use.
+
+        :param str host: host of the Kelvin API
+        :param str username: user to log in with
+        :param str password: password of the user
+        :param kwargs: arguments for `Session`, used only when the session is created
+        """
+        key = (host, username)
+        session = await self._acquire(key, password, kwargs)
+        try:
+            yield session
+        finally:
+            async with self._get_condition():
+                self._in_use[key] -= 1
+                self._condition.notify_all()
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Before Python 3.10 an asyncio.Condition is bound to the event loop that is current
+        # when it is created. So it is created in the running loop, not with the pool.
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def _acquire(self, key: Tuple[str, str], password: str, kwargs) -> Session:
+        async with self._get_condition():
+            session = self._sessions.get(key)
+            if session is None:
+                session = Session(
+                    username=key[1],
+                    password=password,
+                    host=key[0],
+                    **{**self.session_kwargs, **kwargs},
+                )
+                self._sessions[key] = session
+            session.password = password
+            self._sessions.move_to_end(key)
+            if session._client:
+                self._hits += 1
+            else:
+                self._misses += 1
+            # another task may open the session while this one waits
+            while not session._client and self._open_count >= self.max_open:
+                if not await self._evict_idle():
+                    await self._condition.wait()
+            session.open()
+            self._in_use[key] += 1
+            return session
+
+    async def _evict_idle(self) -> bool:
+        """Close the least recently used open session that is not in use."""
+        for key, session in self._sessions.items():
+            if session._client and not self._in_use[key]:
+                logger.debug("Closing least recently used session for %s@%s.", key[1], key[0])
+                await session.close()
+                self._evictions += 1
+                return True
+        return False
+
+    async def close(self) -> None:
+        """Close all sessions."""
+        async with self._get_condition():
+            for session in self._sessions.values():
+                await session.close()
@@ -0,0 +1,773 @@
+#
+# Copyright 2026 Univention GmbH
+#
+# http://www.univention.de/
+#
+# All rights reserved.
+#
+# The source code of this program is made available
+# under the terms of the GNU Affero General Public License version 3
+# (GNU AGPL V3) as published by the Free Software Foundation.
+#
+# Binary versions of this program provided by Univention to you as
+# well as other copyrighted, protected or trademarked materials like
+# Logos, graphics, fonts, specific documentations and configurations,
+# cryptographic keys etc. are subject to a license agreement between
+# you and Univention and not subject to the GNU AGPL V3.
+#
+# In the case you use this program under the terms of the GNU AGPL V3,
+# the program is provided in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License with the Debian GNU/Linux or Univention distribution in file
+# /usr/share/common-licenses/AGPL-3; if not, see
+# <http://www.gnu.org/licenses/>.
+
+import asyncio
+import collections
+import contextlib
+import contextvars
+import datetime
+import email.utils
+import logging
+import random
+import time
+import urllib.parse
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+import httpx
+from tenacity import AsyncRetrying, RetryCallState, before_sleep_log
+
+from .exceptions import CircuitOpen
+
+RETRY_DEFAULT_MIN_PAUSE = 2  # seconds
+RETRY_DEFAULT_MAX_PAUSE = 20  # seconds
+RETRY_DEFAULT_MAX_RETRY_AFTER = 120  # seconds
+RETRY_STATUS_CODES = (
+    httpx.codes.TOO_MANY_REQUESTS,
+    httpx.codes.BAD_GATEWAY,
+    httpx.codes.SERVICE_UNAVAILABLE,
+    httpx.codes.GATEWAY_TIMEOUT,
+)
+RETRY_EXCEPTIONS = (httpx.RemoteProtocolError, httpx.NetworkError)
+# failures after which a request has certainly not been processed by the server
+SAFE_RETRY_STATUS_CODES = (httpx.codes.TOO_MANY_REQUESTS, httpx.codes.SERVICE_UNAVAILABLE)
+SAFE_RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout)
+READ_METHODS = ("GET", "HEAD")
+
+logger = logging.getLogger(__name__)
+_deadline: contextvars.ContextVar = contextvars.ContextVar("kelvin_client_deadline", default=None)
+
+
+@contextlib.contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """
+    All Kelvin API requests in the `with` block, including retries and pauses, must finish
+    within `seconds`. Otherwise `DeadlineExceeded` is raised. Nested deadlines can only
+    shorten the time available.
+
+    >>> with deadline(2.0):
+    ...     user = await UserResource(session=session).get(name="demo_student")
+    """
+    new_deadline = time.monotonic() + seconds
+    current_deadline = _deadline.get()
+    if current_deadline is not None:
+        new_deadline = min(new_deadline, current_deadline)
+    token = _deadline.set(new_deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline_remaining() -> Optional[float]:
+    """Seconds until the current deadline, ``None`` if no deadline is set."""
+    current_deadline = _deadline.get()
+    if current_deadline is None:
+        return None
+    return current_deadline - time.monotonic()
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """
+    Value of the `Retry-After` header of `response` in seconds.
+
+    :return: seconds to wait or ``None`` if the header is missing or cannot be parsed
+    """
+    try:
+        value = response.headers.get("Retry-After")
+    except AttributeError:
+        return None
+    if not isinstance(value, str):
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max((date - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of concurrently running requests.
+
+    The limit starts at `max_limit`. It is multiplied by `backoff_factor` when a request
+    signals an overload (and at most once per generation of requests), and grows additively by
+    one per window of successful requests, up to `max_limit` (AIMD).
+
+    :param int max_limit: initial and highest number of concurrent requests
+    :param int min_limit: lowest number of concurrent requests
+    :param float backoff_factor: factor to multiply the limit with on overload
+    :param float latency_threshold: requests taking longer than this many seconds are treated
+        like overload responses, ``None`` to ignore latency
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        backoff_factor: float = 0.5,
+        latency_threshold: float = None,
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.backoff_factor = backoff_factor
+        self.latency_threshold = latency_threshold
+        self._limit = float(max_limit)
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        """Current number of allowed concurrent requests."""
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def in_flight(self) -> int:
+        """Number of requests currently holding a slot."""
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting for a slot."""
+        return len(self._waiters)
+
+    async def acquire(self) -> float:
+        """
+        Wait for a free slot.
+
+        :return: start time to pass to `release()`
+        """
+        if self._waiters or self._in_flight >= self.limit:
+            waiter = asyncio.get_event_loop().create_future()
+            self._waiters.append(waiter)
+            self._wake_waiters()
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # slot was granted, but we won't use it
+                    self._in_flight -= 1
+                    self._wake_waiters()
+                else:
+                    # `_wake_waiters()` may already have dropped the cancelled waiter
+                    with contextlib.suppress(ValueError):
+                        self._waiters.remove(waiter)
+                raise
+        else:
+            self._in_flight += 1
+        return time.monotonic()
+
+    def release(self, started: Optional[float] = None, overloaded: bool = False) -> None:
+        """
+        Free a slot and adapt the limit.
+
+        :param float started: value returned by `acquire()`, ``None`` to not adapt the limit
+        :param bool overloaded: whether the server signaled an overload
+        """
+        self._in_flight -= 1
+        if started is not None:
+            latency = time.monotonic() - started
+            if self.latency_threshold and latency > self.latency_threshold:
+                overloaded = True
+            if overloaded:
+                self._decrease(started)
+            else:
+                self._limit = min(float(self.max_limit), self._limit + 1 / self._limit)
+        self._wake_waiters()
+
+    def _decrease(self, started: float) -> None:
+        if started < self._last_decrease:
+            # request was dispatched before the last decrease, don't punish twice
+            return
+        self._limit = max(float(self.min_limit), self._limit * self.backoff_factor)
+        self._last_decrease = time.monotonic()
+        logger.debug("Server overloaded, lowered concurrency limit to %d.", self.limit)
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+
+class BackoffGate:
+    """
+    Holds back all new requests of a `Session`, after the server signaled an overload.
+
+    :param float default_pause: seconds to pause, if the server did not send `Retry-After`
+    :param float max_pause: longest pause in seconds
+    """
+
+    def __init__(
+        self, default_pause: float = 1.0, max_pause: float = RETRY_DEFAULT_MAX_RETRY_AFTER
+    ):
+        self.default_pause = default_pause
+        self.max_pause = max_pause
+        self._closed_until = 0.0
+
+    @property
+    def remaining(self) -> float:
+        """Seconds until requests may be sent again."""
+        return max(self._closed_until - time.monotonic(), 0.0)
+
+    def close(self, pause: Optional[float] = None) -> None:
+        """
+        Hold back requests for `pause` seconds (or `default_pause`). A longer pause that is
+        already in effect, is not shortened.
+        """
+        pause = self.default_pause if pause is None else min(pause, self.max_pause)
+        if pause <= 0:
+            return
+        closed_until = time.monotonic() + pause
+        if closed_until > self._closed_until:
+            logger.info("Server overloaded, holding back requests for %.1f seconds.", pause)
+            self._closed_until = closed_until
+
+    async def wait(self) -> None:
+        """Wait until requests may be sent."""
+        remaining = self.remaining
+        while remaining > 0:
+            await asyncio.sleep(remaining)
+            # the pause may have been extended in the meantime
+            remaining = self.remaining
+
+
+class TokenBucket:
+    """
+    Limits the rate of requests to `rate` per second, allowing bursts of up to `burst`
+    requests.
+
+    A bucket can be shared by multiple `Session` objects, to limit their combined rate.
+
+    :param float rate: requests per second
+    :param int burst: number of requests that may be sent at once after an idle period
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0 or burst < 1:
+            raise ValueError("Values of 'rate' and 'burst' must be positive.")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """
+        Take a token, if one is available, without waiting.
+
+        :return: ``0`` if a token was taken, otherwise seconds until one will be available
+        """
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        self._refill()
+        # Take the token right away, even if it is not available yet. Later callers will have to
+        # wait longer, so they are served in order.
+        self._tokens -= 1
+        if self._tokens < 0:
+            try:
+                await asyncio.sleep(-self._tokens / self.rate)
+            except asyncio.CancelledError:
+                self._tokens += 1
+                raise
+
+
+class CircuitBreaker:
+    """
+    Fails requests fast, while the server is down.
+
+    After `failure_threshold` consecutive failed requests (connection errors or server errors),
+    the circuit *opens*: requests are not sent, but `CircuitOpen` is raised right away. After
+    `cool_down` seconds, the circuit is *half-open*: a single request is let through. If it
+    succeeds, the circuit *closes* again, otherwise it opens for another `cool_down` seconds.
+
+    :param int failure_threshold: consecutive failures that open the circuit
+    :param float cool_down: seconds until a request is let through again
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, cool_down: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at < self.cool_down:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def before_request(self, url: str = None) -> None:
+        """
+        :raises ucsschool.kelvin.client.CircuitOpen: if the request must not be sent
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return
+        if state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        raise CircuitOpen(
+            f"Circuit breaker is open after {self.failures} failed requests, not sending "
+            f"request to {url!r}.",
+            url=url,
+        )
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info("Request succeeded, closing circuit breaker.")
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or (self._opened_at is None and self.failures >= self.failure_threshold):
+            logger.warning(
+                "%d consecutive requests failed, opening circuit breaker for %.1f seconds.",
+                self.failures,
+                self.cool_down,
+            )
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    def record_ignored(self) -> None:
+        """A request ended without telling anything about the servers health."""
+        self._probing = False
+
+
+class HostRouter:
+    """
+    Distributes requests over the Kelvin APIs of several UCS nodes.
+
+    Writes (and token requests) are sent to the `primary`. Reads (``GET`` and ``HEAD``) are sent
+    to the healthy replica with the fewest outstanding requests. A replica that could not be
+    connected to is skipped for `cool_down` seconds. If no replica is reachable, reads are sent
+    to the primary.
+
+    :param str primary: host of the Primary Directory Node
+    :param replicas: hosts of Replica Directory Nodes
+    :param float cool_down: seconds a replica is skipped after a connection error
+    """
+
+    def __init__(self, primary: str, replicas: Iterable[str] = (), cool_down: float = 30.0):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.cool_down = cool_down
+        self._outstanding: Dict[str, int] = {host: 0 for host in [primary] + self.replicas}
+        self._down_until: Dict[str, float] = {}
+        self._next = 0
+
+    @property
+    def hosts(self) -> List[str]:
+        return [self.primary] + self.replicas
+
+    def outstanding(self, host: str) -> int:
+        """Number of requests currently sent to `host`."""
+        return self._outstanding[host]
+
+    def is_healthy(self, host: str) -> bool:
+        return time.monotonic() >= self._down_until.get(host, 0.0)
+
+    def candidates(self, method: str) -> List[str]:
+        """Hosts to send a request to, in the order they should be tried."""
+        if method.upper() not in READ_METHODS or not self.replicas:
+            return [self.primary]
+        # rotate, so that replicas with the same number of outstanding requests take turns
+        self._next = (self._next + 1) % len(self.replicas)
+        rotated = self.replicas[self._next :] + self.replicas[: self._next]
+        healthy = sorted((h for h in rotated if self.is_healthy(h)), key=self.outstanding)
+        return healthy + [self.primary]
+
+    def url_for(self, url: str, host: str) -> str:
+        """Replace the host of `url` with `host`, if `url` points to one of the nodes."""
+        parts = urllib.parse.urlsplit(url)
+        if parts.netloc == host or parts.netloc not in self._outstanding:
+            return url
+        return urllib.parse.urlunsplit(parts._replace(netloc=host))
+
+    def acquire(self, host: str) -> None:
+        self._outstanding[host] += 1
+
+    def release(self, host: str) -> None:
+        self._outstanding[host] -= 1
+
+    def mark_down(self, host: str) -> None:
+        if host == self.primary:
+            return
+        logger.warning("Cannot connect to %r, skipping it for %.1f seconds.", host, self.cool_down)
+        self._down_until[host] = time.monotonic() + self.cool_down
+
+
+class _LatencyWindow:
+    """
+    The `sample_size` most recent latencies per HTTP method and endpoint. Endpoints are the
+    first `prefix_segments` parts of the URL path.
+    """
+
+    def __init__(self, min_samples: int, sample_size: int, prefix_segments: int):
+        self.min_samples = min_samples
+        self.sample_size = sample_size
+        self.prefix_segments = prefix_segments
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+
+    def endpoint(self, url: str) -> str:
+        segments = httpx.URL(url).path.strip("/").split("/")
+        prefix = "/".join(segments[: self.prefix_segments])
+        if len(segments) > self.prefix_segments:
+            prefix = f"{prefix}/*"
+        return prefix
+
+    def record(self, method: str, url: str, latency: float) -> None:
+        key = (method.upper(), self.endpoint(url))
+        if key not in self._latencies:
+            self._latencies[key] = collections.deque(maxlen=self.sample_size)
+        self._latencies[key].append(latency)
+
+    def percentile(self, method: str, url: str, percentile: float) -> Optional[float]:
+        """
+        :return: `percentile` of the recent latencies, ``None`` if less than `min_samples`
+            latencies have been recorded
+        """
+        latencies = self._latencies.get((method.upper(), self.endpoint(url)))
+        if not latencies or len(latencies) < self.min_samples:
+            return None
+        latencies = sorted(latencies)
+        return latencies[round(percentile / 100 * (len(latencies) - 1))]
+
+
+class HedgingPolicy:
+    """
+    When to send a second ("hedged") request, if the first one is slow.
+
+    The delay is the `percentile` of the latencies of recent requests with the same method and
+    endpoint (see `AdaptiveTimeouts`), but at least `min_delay` seconds. Until `min_samples`
+    latencies have been recorded for an endpoint, `initial_delay` is used. `fired` counts the
+    hedged requests that were sent, `won` those that finished before the original request.
+
+    :param float percentile: percentile of recent latencies to wait before hedging
+    :param float min_delay: shortest delay in seconds
+    :param float initial_delay: delay in seconds, until enough latencies have been recorded
+    :param int min_samples: latencies needed per endpoint, to calculate the percentile
+    :param int sample_size: number of recent latencies to keep per endpoint
+    :param int prefix_segments: number of URL path segments that identify an endpoint
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        min_delay: float = 0.05,
+        initial_delay: float = 1.0,
+        min_samples: int = 20,
+        sample_size: int = 200,
+        prefix_segments: int = 4,
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.fired = 0
+        self.won = 0
+        self._latencies = _LatencyWindow(min_samples, sample_size, prefix_segments)
+
+    def delay(self, method: str, url: str) -> float:
+        """Seconds to wait for the original request, before sending a hedged one."""
+        latency = self._latencies.percentile(method, url, self.percentile)
+        if latency is None:
+            return self.initial_delay
+        return max(self.min_delay, latency)
+
+    def record_latency(self, method: str, url: str, latency: float) -> None:
+        self._latencies.record(method, url, latency)
+
+
+class AdaptiveTimeouts:
+    """
+    Derives request timeouts from the latencies observed per HTTP method and endpoint.
+
+    The timeout is `multiplier` times the `percentile` of the recent latencies of the same
+    method and endpoint, limited to `floor` and `ceiling` seconds. Until `min_samples`
+    latencies have been recorded for an endpoint, ``None`` is returned, and the static timeout
+    is used. Endpoints are the first `prefix_segments` parts of the URL path, so for example
+    all ``GET /ucsschool/kelvin/v1/users/<name>`` requests share their latencies, and
+    searches (``GET /ucsschool/kelvin/v1/users/``) have their own.
+
+    :param float percentile: percentile of recent latencies to base the timeout on
+    :param float multiplier: factor to multiply the percentile with
+    :param float floor: shortest timeout in seconds
+    :param float ceiling: longest timeout in seconds
+    :param int min_samples: latencies needed per endpoint, to calculate a timeout
+    :param int sample_size: number of recent latencies to keep per endpoint
+    :param int prefix_segments: number of URL path segments that identify an endpoint
+    """
+
+    def __init__(
+        self,
+        percentile: float = 99,
+        multiplier: float = 2.0,
+        floor: float = 1.0,
+        ceiling: float = 60.0,
+        min_samples: int = 20,
+        sample_size: int = 200,
+        prefix_segments: int = 4,
+    ):
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.floor = floor
+        self.ceiling = ceiling
+        self._latencies = _LatencyWindow(min_samples, sample_size, prefix_segments)
+
+    def endpoint(self, url: str) -> str:
+        return self._latencies.endpoint(url)
+
+    def timeout(self, method: str, url: str) -> Optional[float]:
+        """
+        :return: timeout in seconds for a request, ``None`` if not enough latencies have been
+            recorded yet
+        """
+        latency = self._latencies.percentile(method, url, self.percentile)
+        if latency is None:
+            return None
+        return min(self.ceiling, max(self.floor, latency * self.multiplier))
+
+    def record_latency(self, method: str, url: str, latency: float) -> None:
+        self._latencies.record(method, url, latency)
+
+
+class RetryBudget:
+    """
+    Limits retries to a fraction of the recently successful requests, so that retries help
+    with short failures, but don't multiply the load while the server is down.
+
+    Within the last `window` seconds, at most `min_retries` plus `ratio` times the number of
+    successful requests may be retried.
+
+    :param float ratio: allowed retries per successful request
+    :param int min_retries: retries that are always allowed within `window`
+    :param int window: length of the sliding window in seconds
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10, window: int = 10):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        # one [second, successes, retries] entry per second of the window
+        self._buckets: Deque[List[int]] = collections.deque()
+
+    @property
+    def successes(self) -> int:
+        return sum(bucket[1] for bucket in self._current_buckets())
+
+    @property
+    def retries(self) -> int:
+        return sum(bucket[2] for bucket in self._current_buckets())
+
+    def record_success(self) -> None:
+        self._bucket()[1] += 1
+
+    def try_spend(self) -> bool:
+        """
+        Take a retry from the budget.
+
+        :return: whether a retry is allowed
+        """
+        if self.retries >= self.min_retries + self.ratio * self.successes:
+            return False
+        self._bucket()[2] += 1
+        return True
+
+    def _current_buckets(self) -> Deque[List[int]]:
+        oldest = int(time.monotonic()) - self.window
+        while self._buckets and self._buckets[0][0] <= oldest:
+            self._buckets.popleft()
+        return self._buckets
+
+    def _bucket(self) -> List[int]:
+        now = int(time.monotonic())
+        buckets = self._current_buckets()
+        if not buckets or buckets[-1][0] != now:
+            buckets.append([now, 0, 0])
+        return buckets[-1]
+
+
+class RetryPolicy:
+    """
+    When and how long to wait before retrying a request.
+
+    A request is retried, if the response has one of the `status_codes` or if sending it raised
+    one of the `exceptions`. The pause before a retry is taken from the `Retry-After` header
+    of the response (up to `max_retry_after` seconds). Without that header, the pause is chosen
+    randomly between `min_pause` and three times the previous pause, but at most `max_pause`
+    seconds ("decorrelated jitter"), so that clients don't retry in lockstep.
+
+    The policy holds no per-request state and can be shared by multiple `Session` objects.
+
+    :param int retries: how often to retry a request, ``0`` disables retries
+    :param float min_pause: shortest pause between attempts in seconds
+    :param float max_pause: longest pause between attempts in seconds (without `Retry-After`)
+    :param float max_retry_after: longest pause in seconds, when the server sent `Retry-After`
+    :param status_codes: HTTP status codes of responses to retry
+    :param exceptions: exceptions raised while sending a request, that should be retried
+    """
+
+    def __init__(
+        self,
+        retries: int = 0,
+        min_pause: float = RETRY_DEFAULT_MIN_PAUSE,
+        max_pause: float = RETRY_DEFAULT_MAX_PAUSE,
+        max_retry_after: float = RETRY_DEFAULT_MAX_RETRY_AFTER,
+        status_codes: Iterable[int] = RETRY_STATUS_CODES,
+        exceptions: Tuple[Type[BaseException], ...] = RETRY_EXCEPTIONS,
+    ):
+        self.retries = retries
+        self.min_pause = min_pause
+        self.max_pause = max_pause
+        self.max_retry_after = max_retry_after
+        self.status_codes = tuple(status_codes)
+        self.exceptions = exceptions
+        self._retrying = AsyncRetrying(
+            stop=self.stop,
+            wait=self.wait,
+            retry=self.should_retry,
+            before_sleep=before_sleep_log(logger, logging.WARNING),
+            reraise=True,
+        )
+
+    def copy(self, **changes) -> "RetryPolicy":
+        """
+        Get a new policy with the same settings, except for those in `changes`.
+
+        :param changes: arguments of `RetryPolicy`, e.g. ``min_pause=0.1``
+        """
+        kwargs = dict(
+            retries=self.retries,
+            min_pause=self.min_pause,
+            max_pause=self.max_pause,
+            max_retry_after=self.max_retry_after,
+            status_codes=self.status_codes,
+            exceptions=self.exceptions,
+        )
+        kwargs.update(changes)
+        return RetryPolicy(**kwargs)
+
+    def retrying(self, budget: RetryBudget = None, idempotent: bool = True) -> AsyncRetrying:
+        """
+        Get a retry controller for a single request.
+
+        :param budget: if set, each retry is taken from it
+        :param idempotent: if ``False``, only failures are retried, after which the request has
+            certainly not been processed by the server (connection errors, HTTP status 429
+            and 503)
+        """
+        if not budget and idempotent:
+            return self._retrying.copy()
+
+        def should_retry(retry_state: RetryCallState) -> bool:
+            if not self.should_retry(retry_state):
+                return False
+            if not idempotent and not self.is_safe_to_retry(retry_state):
+                return False
+            if not budget or self.stop(retry_state):
+                # let the stop condition end it, without spending the budget
+                return True
+            if budget.try_spend():
+                return True
+            logger.warning("Retry budget exhausted, not retrying.")
+            return False
+
+        return self._retrying.copy(retry=should_retry)
+
+    @staticmethod
+    def is_safe_to_retry(retry_state: RetryCallState) -> bool:
+        """Whether the failed request has certainly not been processed by the server."""
+        if retry_state.outcome.failed:
+            return isinstance(retry_state.outcome.exception(), SAFE_RETRY_EXCEPTIONS)
+        return retry_state.outcome.result().status_code in SAFE_RETRY_STATUS_CODES
+
+    def stop(self, retry_state: RetryCallState) -> bool:
+        if retry_state.attempt_number > self.retries:
+            return True
+        remaining = deadline_remaining()
+        # don't start a pause, that would end after the deadline
+        return remaining is not None and self._next_pause(retry_state) >= remaining
+
+    def should_retry(self, retry_state: RetryCallState) -> bool:
+        if retry_state.outcome.failed:
+            return isinstance(retry_state.outcome.exception(), self.exceptions)
+        return retry_state.outcome.result().status_code in self.status_codes
+
+    def wait(self, retry_state: RetryCallState) -> float:
+        return self._next_pause(retry_state)
+
+    def pause(self, last_pause: float = None) -> float:
+        """
+        Random pause before the next attempt, for callers retrying on their own.
+
+        :param float last_pause: previous pause, ``None`` before the first retry
+        """
+        last_pause = self.min_pause if last_pause is None else last_pause
+        return min(self.max_pause, random.uniform(self.min_pause, last_pause * 3))  # noqa: S311
+
+    def _next_pause(self, retry_state: RetryCallState) -> float:
+        # calculated once per attempt, as both stop() and wait() need it
+        attempt, pause = getattr(retry_state, "_kelvin_next_pause", (None, None))
+        if attempt == retry_state.attempt_number:
+            return pause
+        pause = None
+        if not retry_state.outcome.failed:
+            retry_after = retry_after_seconds(retry_state.outcome.result())
+            if retry_after is not None:
+                pause = min(retry_after, self.max_retry_after)
+        if pause is None:
+            pause = self.pause(getattr(retry_state, "_kelvin_last_pause", None))
+            retry_state._kelvin_last_pause = pause
+        retry_state._kelvin_next_pause = (retry_state.attempt_number, pause)
+        return pause
@@ -27,27 +27,42 @@
 # <http://www.gnu.org/licenses/>.
 
 import asyncio
+import contextlib
 import datetime
+import email.utils
 import logging
+import os
+import ssl
+import threading
+import time
 import uuid
 import warnings
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
 
+import certifi
 import httpx
 import jwt
 from async_property import async_property
-from tenacity import (
-    AsyncRetrying,
-    RetryError,
-    before_sleep_log,
-    retry_if_exception_type,
-    retry_if_result,
-    stop_after_attempt,
-    wait_exponential,
+from tenacity import RetryError
+
+from .exceptions import DeadlineExceeded, InvalidRequest, InvalidToken, NoObject, ServerError
+from .resilience import (
+    SAFE_RETRY_EXCEPTIONS,
+    AdaptiveConcurrencyLimiter,
+    AdaptiveTimeouts,
+    BackoffGate,
+    CircuitBreaker,
+    HedgingPolicy,
+    HostRouter,
+    RetryBudget,
+    RetryPolicy,
+    TokenBucket,
+    _deadline,
+    deadline_remaining,
+    retry_after_seconds,
 )
-
-from .exceptions import InvalidRequest, InvalidToken, NoObject, ServerError
+from .token_store import TokenStore
 
 DN = str
 
@@ -55,8 +70,12 @@ API_VERSION = "v1"
 TOKEN_HASH_ALGORITHM = "HS256"  # noqa: S105
 TOKEN_LEEWAY = 30
 SESSION_DEFAULT_RETRIES = 0
-SESSION_DEFAULT_MIN_RETRY_PAUSE = 2  # seconds
-SESSION_DEFAULT_MAX_RETRY_PAUSE = 20  # seconds
+SESSION_DEFAULT_OVERLOAD_PAUSE = 1.0  # seconds
+# shorter than the Apache default 'KeepAliveTimeout' (5s), so the server doesn't close them first
+SESSION_DEFAULT_KEEPALIVE_EXPIRY = 4.0  # seconds
+IDEMPOTENT_METHODS = ("DELETE", "GET", "HEAD", "PUT")
+HEDGED_METHODS = ("GET", "HEAD")
+OVERLOAD_STATUS_CODES = (httpx.codes.TOO_MANY_REQUESTS, httpx.codes.SERVICE_UNAVAILABLE)
 URL_BASE = "https://{host}/ucsschool/kelvin"
 URL_TOKEN = f"{URL_BASE}/token"
 URL_RESOURCE_CLASS = f"{URL_BASE}/{API_VERSION}/classes/"
@@ -67,6 +86,95 @@ URL_RESOURCE_WORKGROUP = f"{URL_BASE}/{API_VERSION}/workgroups/"
 logger = logging.getLogger(__name__)
 
 
+Timeout = Union[None, float, httpx.Timeout]
+
+
+def _bound_timeout(timeout: Timeout, remaining: float) -> Timeout:
+    """Shorten all parts of `timeout` to at most `remaining` seconds."""
+
+    def bound(value: Optional[float]) -> float:
+        return remaining if value is None else min(value, remaining)
+
+    if isinstance(timeout, httpx.Timeout):
+        return httpx.Timeout(
+            connect=bound(timeout.connect),
+            read=bound(timeout.read),
+            write=bound(timeout.write),
+            pool=bound(timeout.pool),
+        )
+    return bound(timeout)
+
+
+_ssl_contexts: Dict[Tuple[Any, ...], ssl.SSLContext] = {}
+_ssl_contexts_lock = threading.Lock()
+
+
+def _ssl_context(
+    verify: Union[bool, str], cert: Any = None, trust_env: bool = True, http2: bool = False
+) -> ssl.SSLContext:
+    """
+    Get an SSL context for the `verify` and `cert` settings. Creating an SSL context (and
+    reading the CA certificates) takes several milliseconds, so contexts are cached and shared
+    by all `Session` objects of the process.
+    """
+    if verify is True and trust_env:
+        # same as httpx
+        verify = os.environ.get("SSL_CERT_FILE") or os.environ.get("SSL_CERT_DIR") or True
+    if isinstance(cert, list):
+        cert = tuple(cert)
+    key = (verify, cert, http2)
+    with _ssl_contexts_lock:
+        if key not in _ssl_contexts:
+            _ssl_contexts[key] = _create_ssl_context(verify, cert, http2)
+        return _ssl_contexts[key]
+
+
+def _create_ssl_context(verify: Union[bool, str], cert: Any, http2: bool) -> ssl.SSLContext:
+    if verify is False:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    elif verify is True:
+        context = ssl.create_default_context(cafile=certifi.where())
+    elif os.path.isdir(verify):
+        context = ssl.create_default_context(capath=verify)
+    else:
+        context = ssl.create_default_context(cafile=verify)
+    if cert:
+        if isinstance(cert, str):
+            context.load_cert_chain(certfile=cert)
+        else:
+            context.load_cert_chain(*cert)
+    context.set_alpn_protocols(["http/1.1", "h2"] if http2 else ["http/1.1"])
+    return context
+
+
+def clear_ssl_context_cache() -> None:
+    """Drop cached SSL contexts, e.g. after the CA certificate file has changed."""
+    with _ssl_contexts_lock:
+        _ssl_contexts.clear()
+
+
+class UnixSocketTransport(httpx.AsyncBaseTransport):
+    """
+    Send requests over a Unix domain socket, e.g. to a Kelvin API on the same host.
+
+    The URLs are not changed, but ``https`` requests are sent as plain HTTP, as the
+    connection does not leave the host.
+    """
+
+    def __init__(self, uds: str, **kwargs):
+        self._transport = httpx.AsyncHTTPTransport(uds=uds, **kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.scheme == "https":
+            request.url = request.url.copy_with(scheme="http")
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
 class KelvinClientWarning(Warning): ...
 
 
@@ -98,52 +206,114 @@ class Token:
             raise InvalidToken(f"Error parsing date in token ({token_str!r}): {exc!s}") from exc
         return cls(expiry=expiry, value=token_str)
 
-    def is_valid(self) -> bool:
+    def is_valid(self, clock_offset: datetime.timedelta = None) -> bool:
+        """
+        :param clock_offset: difference between the servers and the local clock
+        """
         if not self.expiry or not self.value:
             return False
-        return datetime.datetime.utcnow() + datetime.timedelta(seconds=TOKEN_LEEWAY) <= self.expiry
+        return self.seconds_left(clock_offset) >= TOKEN_LEEWAY
+
+    def seconds_left(self, clock_offset: datetime.timedelta = None) -> float:
+        """
+        :param clock_offset: difference between the servers and the local clock
+        :return: seconds until the token expires (on the server)
+        """
+        server_now = datetime.datetime.utcnow() + (clock_offset or datetime.timedelta(0))
+        return (self.expiry - server_now).total_seconds()
+
+
+TokenProvider = Callable[[], Awaitable[str]]
 
 
 class Session:
     def __init__(
         self,
-        username: str,
-        password: str,
-        host: str,
+        username: str = None,
+        password: str = None,
+        host: Union[str, List[str]] = None,
         max_client_tasks: int = 10,
         request_id: str = None,
         request_id_header: str = "X-Request-ID",
         language: str = None,
-        retries: int = SESSION_DEFAULT_RETRIES,
+        retries: int = None,
+        token_refresh_fraction: float = None,
+        token_store: TokenStore = None,
+        overload_latency: float = None,
+        overload_pause: float = SESSION_DEFAULT_OVERLOAD_PAUSE,
+        http2: bool = False,
+        keepalive_expiry: float = SESSION_DEFAULT_KEEPALIVE_EXPIRY,
+        retry_policy: RetryPolicy = None,
+        rate_limits: Dict[str, TokenBucket] = None,
+        retry_budget: RetryBudget = None,
+        circuit_breaker: CircuitBreaker = None,
+        hedging: HedgingPolicy = None,
+        adaptive_timeouts: AdaptiveTimeouts = None,
+        token_provider: TokenProvider = None,
+        uds: str = None,
         **kwargs,
     ):
+        if not host:
+            raise TypeError("Argument 'host' is required.")
+        if not token_provider and (username is None or password is None):
+            raise TypeError("Arguments 'username' and 'password' or 'token_provider' are required.")
+        if retries is not None and retry_policy:
+            raise TypeError("Arguments 'retries' and 'retry_policy' are mutually exclusive.")
         if max_client_tasks < 4:
             txt = "Raising value of 'max_client_tasks' to its minimum of 4."
             warnings.warn(txt, BadSettingsWarning, stacklevel=2)
             logger.warning(txt)
             max_client_tasks = 4
+        if token_refresh_fraction is not None and not 0 < token_refresh_fraction < 1:
+            raise ValueError("Value of 'token_refresh_fraction' must be between 0 and 1.")
         self.max_client_tasks = max_client_tasks
         self._client: Optional[httpx.AsyncClient] = None
-        self._client_task_limiter = asyncio.Semaphore(max_client_tasks)
+        self._client_task_limiter = AdaptiveConcurrencyLimiter(
+            max_client_tasks, latency_threshold=overload_latency
+        )
+        self._backoff_gate = BackoffGate(default_pause=overload_pause)
+        self.rate_limits = {
+            method.upper(): bucket for method, bucket in (rate_limits or {}).items()
+        }
         self.username = username
         self.password = password
-        self.host = host
+        if isinstance(host, str):
+            host = [host]
+        self.hosts: List[str] = list(host)
+        self.host = self.hosts[0]
+        self.router = HostRouter(self.host, self.hosts[1:]) if len(self.hosts) > 1 else None
         self.request_id = request_id or uuid.uuid4().hex
         self.request_id_header = request_id_header
         self.language = language
-        self._retries = retries
-        self._min_retry_pause = SESSION_DEFAULT_MIN_RETRY_PAUSE
-        self._max_retry_pause = SESSION_DEFAULT_MAX_RETRY_PAUSE
+        self.retry_policy = retry_policy or RetryPolicy(
+            retries=SESSION_DEFAULT_RETRIES if retries is None else retries
+        )
+        self.retry_budget = retry_budget or RetryBudget()
+        self.circuit_breaker = circuit_breaker
+        self.hedging = hedging
+        self.adaptive_timeouts = adaptive_timeouts
+        self.http2 = http2
+        self.keepalive_expiry = keepalive_expiry
+        self.uds = uds
         self.kwargs = kwargs
         self.urls = {
-            "token": URL_TOKEN.format(host=host),
-            "class": URL_RESOURCE_CLASS.format(host=host),
-            "role": URL_RESOURCE_ROLE.format(host=host),
-            "school": URL_RESOURCE_SCHOOL.format(host=host),
-            "user": URL_RESOURCE_USER.format(host=host),
-            "workgroup": URL_RESOURCE_WORKGROUP.format(host=host),
+            "token": URL_TOKEN.format(host=self.host),
+            "class": URL_RESOURCE_CLASS.format(host=self.host),
+            "role": URL_RESOURCE_ROLE.format(host=self.host),
+            "school": URL_RESOURCE_SCHOOL.format(host=self.host),
+            "user": URL_RESOURCE_USER.format(host=self.host),
+            "workgroup": URL_RESOURCE_WORKGROUP.format(host=self.host),
         }
+        self.token_provider = token_provider
         self._token: Optional[Token] = None
+        # created on first use, see `_get_token_lock()`
+        self._token_lock: Optional[asyncio.Lock] = None
+        # difference between the servers and the local clock, estimated from token responses
+        self._clock_offset = datetime.timedelta(0)
+        self.token_refresh_fraction = token_refresh_fraction
+        self._token_refresh_task: Optional[asyncio.Task] = None
+        self.token_store = token_store
+        self._pid = os.getpid()
 
     async def __aenter__(self):
         self.open()
@@ -153,81 +323,289 @@ class Session:
         await self.close()
 
     def open(self) -> httpx.AsyncClient:
+        self._check_fork()
         if not self._client:
             self.kwargs["headers"] = self.kwargs.get("headers", {})
             self.kwargs["headers"]["Access-Control-Expose-Headers"] = self.request_id_header
             self.kwargs["headers"][self.request_id_header] = self.request_id
-            self._client = httpx.AsyncClient(**self.kwargs)
+            if self.http2:
+                self.kwargs.setdefault("http2", True)
+            self.kwargs.setdefault("limits", self._client_limits())
+            client_kwargs = dict(self.kwargs)
+            if self.uds and "transport" not in client_kwargs:
+                client_kwargs["transport"] = UnixSocketTransport(
+                    self.uds,
+                    http2=client_kwargs.get("http2", False),
+                    limits=client_kwargs["limits"],
+                )
+            verify = client_kwargs.get("verify", True)
+            if "transport" not in client_kwargs and isinstance(verify, (bool, str)):
+                client_kwargs["verify"] = _ssl_context(
+                    verify,
+                    client_kwargs.pop("cert", None),
+                    client_kwargs.get("trust_env", True),
+                    client_kwargs.get("http2", False),
+                )
+            self._client = httpx.AsyncClient(**client_kwargs)
         return self._client
 
+    def _client_limits(self) -> httpx.Limits:
+        # One connection per client task. With HTTP/2 all requests are multiplexed over few
+        # connections, the limit only matters, if the server does not support HTTP/2.
+        # Idle connections are closed before the server closes them, so that requests are not
+        # sent over dead sockets.
+        return httpx.Limits(
+            max_connections=self.max_client_tasks,
+            max_keepalive_connections=self.max_client_tasks,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
     async def close(self) -> None:
+        self._check_fork()
+        if self._token_refresh_task:
+            self._token_refresh_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._token_refresh_task
+            self._token_refresh_task = None
         if self._client:
             await self._client.aclose()
         self._client = None
 
+    def _check_fork(self) -> None:
+        """
+        A process forked from the one that opened the Session (e.g. a worker of a prefork
+        server) must not use the parent's connections and asyncio objects. They are replaced,
+        but the token is kept, as it is still valid.
+        """
+        if self._pid == os.getpid():
+            return
+        logger.debug(
+            "[%s] Process was forked (PID %d -> %d), recreating HTTP client.",
+            self.request_id[:10],
+            self._pid,
+            os.getpid(),
+        )
+        self._pid = os.getpid()
+        # Don't close the client, that would close the parent's connections.
+        was_open = self._client is not None
+        self._client = None
+        self._client_task_limiter = AdaptiveConcurrencyLimiter(
+            self.max_client_tasks, latency_threshold=self._client_task_limiter.latency_threshold
+        )
+        self._token_lock = None
+        # the task belongs to the parent's event loop, the token is refreshed lazily instead
+        self._token_refresh_task = None
+        if was_open:
+            self.open()
+
     @property
     def client(self) -> httpx.AsyncClient:
+        self._check_fork()
         if not self._client:
             raise RuntimeError("Session is closed.")
         return self._client
 
+    @property
+    def _min_retry_pause(self) -> float:
+        return self.retry_policy.min_pause
+
+    @_min_retry_pause.setter
+    def _min_retry_pause(self, value: float) -> None:
+        # the policy may be shared with other Sessions
+        self.retry_policy = self.retry_policy.copy(min_pause=value)
+
+    @property
+    def _max_retry_pause(self) -> float:
+        return self.retry_policy.max_pause
+
+    @_max_retry_pause.setter
+    def _max_retry_pause(self, value: float) -> None:
+        # the policy may be shared with other Sessions
+        self.retry_policy = self.retry_policy.copy(max_pause=value)
+
+    @property
+    def concurrency_limit(self) -> int:
+        """Number of requests currently allowed to run concurrently."""
+        return self._client_task_limiter.limit
+
+    @property
+    def overload_pause_remaining(self) -> float:
+        """Seconds until requests are sent again, after the server signaled an overload."""
+        return self._backoff_gate.remaining
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting for the concurrency limiter."""
+        return self._client_task_limiter.queue_depth
+
     @async_property
     async def token(self) -> str:
-        if not self._token or not self._token.is_valid():
-            resp_json = await self.post(
-                self.urls["token"],
-                headers={"Content-Type": "application/x-www-form-urlencoded"},
-                data={"username": self.username, "password": self.password},
-            )
-            self._token = Token.from_str(resp_json["access_token"])
+        self._check_fork()
+        if not self._token or not self._token.is_valid(self._clock_offset):
+            async with self._get_token_lock():
+                # Another task may have refreshed the token while we were waiting for the lock.
+                if not self._token or not self._token.is_valid(self._clock_offset):
+                    stored_token = self._load_stored_token()
+                    if stored_token and stored_token.is_valid(self._clock_offset):
+                        self._token = stored_token
+                    else:
+                        self._token = await self._fetch_token()
+                    self._schedule_token_refresh()
+        return self._token.value
+
+    def _get_token_lock(self) -> asyncio.Lock:
+        # Before Python 3.10 an asyncio.Lock is bound to the event loop that is current when it
+        # is created. So it is created in the running loop, not when the Session is created.
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        return self._token_lock
+
+    async def _replace_token(self, rejected_token: str) -> str:
+        """
+        Get a new token from the Kelvin API, because `rejected_token` was rejected. If multiple
+        tasks do this concurrently, only one new token is requested.
+        """
+        async with self._get_token_lock():
+            if not self._token or self._token.value == rejected_token:
+                # don't use the token store, it probably contains the rejected token
+                self._token = await self._fetch_token()
+                self._schedule_token_refresh()
         return self._token.value
 
+    async def _fetch_token(self) -> Token:
+        if self.token_provider:
+            return Token.from_str(await self.token_provider())
+        resp_json = await self.post(
+            self.urls["token"],
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            data={"username": self.username, "password": self.password},
+            # requesting a token has no side effects
+            idempotent=True,
+        )
+        token = Token.from_str(resp_json["access_token"])
+        if self.token_store:
+            try:
+                self.token_store.set(self._token_store_key, token.value)
+            except Exception as exc:
+                logger.warning("[%s] Error storing token: %s", self.request_id[:10], exc)
+        return token
+
+    @property
+    def _token_store_key(self) -> str:
+        return f"{self.username}@{self.host}"
+
+    def _load_stored_token(self) -> Optional[Token]:
+        if not self.token_store or self.token_provider:
+            return None
+        try:
+            token_str = self.token_store.get(self._token_store_key)
+            return Token.from_str(token_str) if token_str else None
+        except Exception as exc:
+            logger.warning("[%s] Error loading stored token: %s", self.request_id[:10], exc)
+            return None
+
+    def _schedule_token_refresh(self) -> None:
+        """
+        If `token_refresh_fraction` is set, start a background task that fetches a new
+        token after that fraction of the current token's lifetime has passed.
+        """
+        if not self.token_refresh_fraction or not self._client:
+            return
+        if self._token_refresh_task:
+            self._token_refresh_task.cancel()
+        lifetime = self._token.seconds_left(self._clock_offset)
+        delay = max(lifetime * self.token_refresh_fraction, 0)
+        self._token_refresh_task = asyncio.ensure_future(self._refresh_token_later(delay))
+
+    async def _refresh_token_later(self, delay: float) -> None:
+        # The task inherited the context of the request that fetched the token. That request's
+        # deadline does not apply to the refresh.
+        _deadline.set(None)
+        await asyncio.sleep(delay)
+        try:
+            async with self._get_token_lock():
+                self._token = await self._fetch_token()
+        except Exception as exc:
+            # The token will be refreshed lazily on the next request instead.
+            logger.warning("[%s] Background token refresh failed: %s", self.request_id[:10], exc)
+            self._token_refresh_task = None
+            return
+        logger.debug("[%s] Refreshed token in background.", self.request_id[:10])
+        self._token_refresh_task = None
+        self._schedule_token_refresh()
+
     @async_property
     async def json_headers(self) -> Dict[str, str]:
+        return await self._json_headers()
+
+    async def _json_headers(self, language: str = None) -> Dict[str, str]:
+        """
+        :param str language: value for the ``Accept-Language`` header instead of the Session's
+        """
         headers = {
             "accept": "application/json",
             "Authorization": f"Bearer {await self.token}",
             "Content-Type": "application/json",
         }
-        if self.language:
-            headers["Accept-Language"] = self.language
+        language = language or self.language
+        if language:
+            headers["Accept-Language"] = language
         return headers
 
     async def request(
-        self, async_request_method: Any, url: str, return_json: bool = True, **kwargs
+        self,
+        async_request_method: Any,
+        url: str,
+        return_json: bool = True,
+        default_timeout: float = None,
+        language: str = None,
+        primary: bool = False,
+        idempotent: bool = None,
+        **kwargs,
     ) -> Union[str, int, Dict[str, Any]]:
-        if "headers" not in kwargs:
-            kwargs["headers"] = await self.json_headers
+        """
+        :param float default_timeout: timeout to use instead of the Session's one, if no
+            `timeout` argument was passed and no adaptive timeout is available
+        :param str language: value for the ``Accept-Language`` header of this request,
+            instead of the Session's `language`
+        :param bool primary: send the request to the primary host, even if it is a read that
+            would be sent to a replica (e.g. to read an object that was just created)
+        :param bool idempotent: whether the request may be resent after failures that leave
+            open, whether the server processed it, ``None`` to decide by the HTTP method
+        """
+        if idempotent is None:
+            idempotent = async_request_method.__name__.upper() in IDEMPOTENT_METHODS
+        self._check_deadline(async_request_method, url)
+        # whether the Authorization header is the Session's own
+        session_auth = "headers" not in kwargs
+        if session_auth:
+            kwargs["headers"] = await self._json_headers(language)
+        elif language:
+            kwargs["headers"] = {**kwargs["headers"], "Accept-Language": language}
         if "timeout" not in kwargs:
-            kwargs["timeout"] = self.kwargs.get("timeout", 10.0)
-
-        retrying = AsyncRetrying(
-            stop=stop_after_attempt(self._retries + 1),
-            wait=wait_exponential(
-                multiplier=1, min=self._min_retry_pause, max=self._max_retry_pause
-            ),
-            retry=(
-                retry_if_result(
-                    lambda r: (
-                        r.status_code
-                        in (
-                            httpx.codes.TOO_MANY_REQUESTS,
-                            httpx.codes.BAD_GATEWAY,
-                            httpx.codes.SERVICE_UNAVAILABLE,
-                            httpx.codes.GATEWAY_TIMEOUT,
-                        )
-                    )
-                )
-                | retry_if_exception_type((httpx.RemoteProtocolError, httpx.NetworkError))
-            ),
-            before_sleep=before_sleep_log(logger, logging.WARNING),
-            reraise=True,
-        )
+            kwargs["timeout"] = self._timeout(async_request_method, url, default_timeout)
+        remaining = self._check_deadline(async_request_method, url)
+        if remaining is not None:
+            kwargs["timeout"] = _bound_timeout(kwargs["timeout"], remaining)
 
-        try:
-            response: httpx.Response = await retrying(async_request_method, url, **kwargs)
-        except RetryError as exc:
-            response = exc.last_attempt.result()
+        response = await self._send_with_retries(
+            async_request_method, url, idempotent, primary=primary, **kwargs
+        )
+        if response.status_code == httpx.codes.UNAUTHORIZED and session_auth:
+            # token was rejected early (clock skew, key rotation, server restart)
+            logger.info(
+                "[%s] Token was rejected for %s %r, requesting a new one and resending request.",
+                self.request_id[:10],
+                async_request_method.__name__.upper(),
+                url,
+            )
+            authorization = kwargs["headers"]["Authorization"]
+            # If another task already replaced the token, that one is used.
+            new_token = await self._replace_token(authorization[len("Bearer ") :])
+            kwargs["headers"]["Authorization"] = f"Bearer {new_token}"
+            response = await self._send_with_retries(
+                async_request_method, url, idempotent, primary=primary, **kwargs
+            )
 
         try:
             resp_json = response.json()
@@ -277,6 +655,257 @@ class Session:
                 reason=response.reason_phrase, status=response.status_code, url=url
             )  # pragma: no cover
 
+    async def _send_with_retries(
+        self, async_request_method: Any, url: str, idempotent: bool, **kwargs
+    ) -> httpx.Response:
+        retrying = self.retry_policy.retrying(self.retry_budget, idempotent=idempotent)
+        try:
+            response: httpx.Response = await self._with_deadline(
+                retrying(self._send, async_request_method, url, idempotent=idempotent, **kwargs),
+                async_request_method,
+                url,
+            )
+        except RetryError as exc:
+            response = exc.last_attempt.result()
+        if response.status_code not in self.retry_policy.status_codes:
+            self.retry_budget.record_success()
+        return response
+
+    def _timeout(
+        self, async_request_method: Any, url: str, default_timeout: float = None
+    ) -> Timeout:
+        if self.adaptive_timeouts:
+            timeout = self.adaptive_timeouts.timeout(async_request_method.__name__, url)
+            if timeout is not None:
+                return timeout
+        if default_timeout is not None:
+            return default_timeout
+        return self.kwargs.get("timeout", 10.0)
+
+    @staticmethod
+    def _check_deadline(async_request_method: Any, url: str) -> Optional[float]:
+        """
+        :return: seconds until the current deadline, ``None`` if no deadline is set
+        :raises ucsschool.kelvin.client.DeadlineExceeded: if the deadline has passed
+        """
+        remaining = deadline_remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(
+                f"Deadline exceeded before {async_request_method.__name__.upper()} {url!r}.",
+                url=url,
+            )
+        return remaining
+
+    async def _with_deadline(
+        self, coro: Awaitable[httpx.Response], async_request_method: Any, url: str
+    ) -> httpx.Response:
+        remaining = deadline_remaining()
+        if remaining is None:
+            return await coro
+        try:
+            return await asyncio.wait_for(coro, max(remaining, 0))
+        except (asyncio.TimeoutError, httpx.TimeoutException) as exc:
+            if deadline_remaining() > 0:
+                raise
+            raise DeadlineExceeded(
+                f"Deadline exceeded during {async_request_method.__name__.upper()} {url!r}.",
+                url=url,
+            ) from exc
+
+    async def _send(self, async_request_method: Any, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a single request, unless the circuit breaker is open.
+
+        :raises ucsschool.kelvin.client.CircuitOpen: if the circuit breaker is open
+        """
+        if self.hedging and async_request_method.__name__.upper() in HEDGED_METHODS:
+            dispatch = self._dispatch_hedged
+        else:
+            dispatch = self._dispatch_routed
+        if not self.circuit_breaker:
+            return await dispatch(async_request_method, url, **kwargs)
+        self.circuit_breaker.before_request(url)
+        try:
+            response = await dispatch(async_request_method, url, **kwargs)
+        except httpx.TransportError:
+            self.circuit_breaker.record_failure()
+            raise
+        except BaseException:
+            self.circuit_breaker.record_ignored()
+            raise
+        if response.status_code >= 500:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+        return response
+
+    async def _dispatch_hedged(
+        self, async_request_method: Any, url: str, **kwargs
+    ) -> httpx.Response:
+        """
+        Send a request and, if it takes longer than usual, send the same request a second time.
+        The first successful response is used, the other request is cancelled.
+        """
+
+        async def timed_dispatch() -> Tuple[httpx.Response, float]:
+            started = time.monotonic()
+            response = await self._dispatch_routed(async_request_method, url, **kwargs)
+            return response, time.monotonic() - started
+
+        original = asyncio.ensure_future(timed_dispatch())
+        pending = {original}
+        done: Set[asyncio.Future] = set()
+        try:
+            done, pending = await asyncio.wait(
+                pending, timeout=self.hedging.delay(async_request_method.__name__, url)
+            )
+            if not done:
+                logger.debug(
+                    "[%s] %s %r is slow, sending hedged request.",
+                    self.request_id[:10],
+                    async_request_method.__name__.upper(),
+                    url,
+                )
+                self.hedging.fired += 1
+                pending.add(asyncio.ensure_future(timed_dispatch()))
+            while True:
+                if not done:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # prefer the original request, if both finished
+                task = original if original in done else done.pop()
+                done.discard(task)
+                if task.exception() is None or not (pending or done):
+                    break
+            response, latency = task.result()
+            self.hedging.record_latency(async_request_method.__name__, url, latency)
+            if task is not original:
+                self.hedging.won += 1
+            return response
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+            for task in done | pending:
+                # retrieve exceptions of the unused request, so that asyncio doesn't log them
+                if not task.cancelled():
+                    task.exception()
+
+    async def _dispatch_routed(
+        self, async_request_method: Any, url: str, primary: bool = False, **kwargs
+    ) -> httpx.Response:
+        """
+        Send a request to one of the nodes, if the Session was configured with multiple hosts.
+        Reads fail over to the next node on connection errors.
+
+        :param bool primary: send the request to the primary host
+        """
+        if not self.router:
+            return await self._dispatch(async_request_method, url, **kwargs)
+        if primary:
+            candidates = [self.router.primary]
+        else:
+            candidates = self.router.candidates(async_request_method.__name__)
+        for num, host in enumerate(candidates, start=1):
+            self.router.acquire(host)
+            try:
+                return await self._dispatch(
+                    async_request_method, self.router.url_for(url, host), **kwargs
+                )
+            except SAFE_RETRY_EXCEPTIONS as exc:
+                self.router.mark_down(host)
+                if num == len(candidates):
+                    raise
+                logger.debug(
+                    "[%s] %s %r: cannot connect to %r (%s), failing over.",
+                    self.request_id[:10],
+                    async_request_method.__name__.upper(),
+                    url,
+                    host,
+                    exc,
+                )
+            finally:
+                self.router.release(host)
+
+    async def _dispatch(
+        self, async_request_method: Any, url: str, idempotent: bool = False, **kwargs
+    ) -> httpx.Response:
+        """
+        Send a single request, holding a slot of the concurrency limiter. Waits, while the
+        Session holds back requests because of an overloaded server or a rate limit.
+
+        :param bool idempotent: whether the request may be resent on a closed connection
+        """
+        method = async_request_method.__name__.upper()
+        rate_limit = self.rate_limits.get(method, self.rate_limits.get("*"))
+        while True:
+            started = await self._client_task_limiter.acquire()
+            # The server may have signaled an overload while this request was queued.
+            if self._backoff_gate.remaining:
+                self._client_task_limiter.release()
+                await self._backoff_gate.wait()
+                continue
+            # Take the token right before sending, so requests that waited for a slot are not
+            # sent in a burst. Don't hold the slot while waiting for a token, requests of
+            # methods that are not throttled may use it meanwhile.
+            rate_limit_delay = rate_limit.try_acquire() if rate_limit else 0
+            if not rate_limit_delay:
+                break
+            self._client_task_limiter.release()
+            await asyncio.sleep(rate_limit_delay)
+        try:
+            try:
+                response: httpx.Response = await async_request_method(url, **kwargs)
+            except httpx.RemoteProtocolError as exc:
+                if not idempotent:
+                    raise
+                # most likely the server closed an idle keep-alive connection, resend right away
+                logger.debug(
+                    "[%s] %s %r: %s. Resending request.",
+                    self.request_id[:10],
+                    method,
+                    url,
+                    exc,
+                )
+                response = await async_request_method(url, **kwargs)
+        except httpx.TimeoutException:
+            self._client_task_limiter.release(started, overloaded=True)
+            # so the timeout grows, if the server became slower
+            self._record_latency(method, url, started)
+            raise
+        except BaseException:
+            self._client_task_limiter.release()
+            raise
+        overloaded = response.status_code in OVERLOAD_STATUS_CODES
+        self._client_task_limiter.release(started, overloaded=overloaded)
+        if url == self.urls["token"]:
+            self._update_clock_offset(response)
+        if overloaded:
+            self._backoff_gate.close(retry_after_seconds(response))
+        else:
+            self._record_latency(method, url, started)
+        return response
+
+    def _update_clock_offset(self, response: httpx.Response) -> None:
+        """Estimate the difference between the servers and the local clock."""
+        try:
+            server_date = email.utils.parsedate_to_datetime(response.headers["Date"])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return
+        if server_date.tzinfo is not None:
+            server_date = server_date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        self._clock_offset = server_date - datetime.datetime.utcnow()
+        if abs(self._clock_offset.total_seconds()) > TOKEN_LEEWAY:
+            logger.warning(
+                "[%s] Clock of Kelvin API server differs from local clock by %.0f seconds.",
+                self.request_id[:10],
+                self._clock_offset.total_seconds(),
+            )
+
+    def _record_latency(self, method: str, url: str, started: float) -> None:
+        if self.adaptive_timeouts:
+            self.adaptive_timeouts.record_latency(method, url, time.monotonic() - started)
+
     async def delete(self, url: str, **kwargs) -> None:
         await self.request(self.client.delete, url, return_json=False, **kwargs)
 
@@ -0,0 +1,225 @@
+#
+# Copyright 2026 Univention GmbH
+#
+# http://www.univention.de/
+#
+# All rights reserved.
+#
+# The source code of this program is made available
+# under the terms of the GNU Affero General Public License version 3
+# (GNU AGPL V3) as published by the Free Software Foundation.
+#
+# Binary versions of this program provided by Univention to you as
+# well as other copyrighted, protected or trademarked materials like
+# Logos, graphics, fonts, specific documentations and configurations,
+# cryptographic keys etc. are subject to a license agreement between
+# you and Univention and not subject to the GNU AGPL V3.
+#
+# In the case you use this program under the terms of the GNU AGPL V3,
+# the program is provided in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License with the Debian GNU/Linux or Univention distribution in file
+# /usr/share/common-licenses/AGPL-3; if not, see
+# <http://www.gnu.org/licenses/>.
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import Any, Awaitable, Iterator, List, Type, TypeVar
+
+from .base import KelvinObject, KelvinResource
+from .role import RoleResource
+from .school import SchoolResource
+from .school_class import SchoolClassResource
+from .session import Session
+from .user import UserResource
+from .workgroup import WorkGroupResource
+
+T = TypeVar("T")
+
+
+class SyncSession:
+    """
+    Synchronous access to the Kelvin API.
+
+    A `Session` is opened in an event loop running in a background thread, and is kept open
+    until `close()` is called. All requests of the `SyncSession` share its connections and
+    token. Arguments are the same as those of `Session`.
+
+    Use it as a context manager or call `close()` when done::
+
+        with SyncSession(username="Administrator", password="s3cr3t", host="m.ex.com") as kelvin:
+            user = SyncUserResource(kelvin).get(name="demo_student")
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._start_loop()
+        try:
+            self.session: Session = self.run(self._open_session(*args, **kwargs))
+        except BaseException:
+            self._stop_loop()
+            raise
+
+    def _start_loop(self) -> None:
+        self._pid = os.getpid()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="kelvin-client-loop", daemon=True
+        )
+        self._thread.start()
+
+    def _stop_loop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self) -> "SyncSession":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    async def _open_session(*args, **kwargs) -> Session:
+        # asyncio objects of the Session must be created in the thread of the event loop
+        session = Session(*args, **kwargs)
+        session.open()
+        return session
+
+    @property
+    def closed(self) -> bool:
+        return self._loop.is_closed()
+
+    def run(self, coro: Awaitable[T], timeout: float = None) -> T:
+        """
+        Run a coroutine in the event loop of the session and wait for its result.
+
+        :param coro: coroutine, e.g. ``user.save()``
+        :param float timeout: seconds to wait for the result, `None` to wait forever
+        :return: result of the coroutine
+        :raises concurrent.futures.TimeoutError: if `timeout` expired, the coroutine is cancelled
+        """
+        if self.closed:
+            if asyncio.iscoroutine(coro):
+                coro.close()
+            raise RuntimeError("SyncSession has been closed.")
+        if self._pid != os.getpid():
+            # The thread of the event loop does not exist in a forked process. The Session
+            # replaces its client in the new loop and keeps its token.
+            self._start_loop()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # don't let e.g. a `save()` complete after the caller has given up
+            future.cancel()
+            raise
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self.run(self.session.close())
+        finally:
+            self._stop_loop()
+
+
+class SyncKelvinObject:
+    """
+    Synchronous wrapper around a `KelvinObject`.
+
+    Attributes are read from and written to the wrapped object. `save()`, `reload()` and
+    `delete()` block until the request is done.
+
+    :param obj: the Kelvin object, e.g. a `User`
+    :param sync_session: the `SyncSession` to run the requests in
+    """
+
+    def __init__(self, obj: KelvinObject, sync_session: SyncSession):
+        object.__setattr__(self, "_obj", obj)
+        object.__setattr__(self, "_sync_session", sync_session)
+        if obj.session is None:
+            obj.session = sync_session.session
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._obj, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._obj, name, value)
+
+    def __repr__(self):
+        return repr(self._obj)
+
+    @property
+    def obj(self) -> KelvinObject:
+        """The wrapped (asynchronous) Kelvin object."""
+        return self._obj
+
+    def reload(self) -> "SyncKelvinObject":
+        self._sync_session.run(self._obj.reload())
+        return self
+
+    def save(self) -> "SyncKelvinObject":
+        self._sync_session.run(self._obj.save())
+        return self
+
+    def delete(self) -> None:
+        self._sync_session.run(self._obj.delete())
+
+
+class SyncKelvinResource:
+    """
+    Synchronous counterpart of a `KelvinResource`.
+
+    :param sync_session: the `SyncSession` to run the requests in
+    :param str language: language for the ``Accept-Language`` header
+    """
+
+    resource_class: Type[KelvinResource] = KelvinResource
+
+    def __init__(self, sync_session: SyncSession, language: str = None):
+        self.sync_session = sync_session
+        self.resource = self.resource_class(session=sync_session.session, language=language)
+
+    def _wrap(self, obj: KelvinObject) -> SyncKelvinObject:
+        return SyncKelvinObject(obj, self.sync_session)
+
+    def get(self, **kwargs) -> SyncKelvinObject:
+        return self._wrap(self.sync_session.run(self.resource.get(**kwargs)))
+
+    def exists(self, **kwargs) -> bool:
+        return self.sync_session.run(self.resource.exists(**kwargs))
+
+    def get_from_url(self, url: str) -> SyncKelvinObject:
+        return self._wrap(self.sync_session.run(self.resource.get_from_url(url)))
+
+    def search(self, **kwargs) -> Iterator[SyncKelvinObject]:
+        async def _search() -> List[KelvinObject]:
+            return [obj async for obj in self.resource.search(**kwargs)]
+
+        for obj in self.sync_session.run(_search()):
+            yield self._wrap(obj)
+
+
+class SyncRoleResource(SyncKelvinResource):
+    resource_class = RoleResource
+
+
+class SyncSchoolResource(SyncKelvinResource):
+    resource_class = SchoolResource
+
+
+class SyncSchoolClassResource(SyncKelvinResource):
+    resource_class = SchoolClassResource
+
+
+class SyncUserResource(SyncKelvinResource):
+    resource_class = UserResource
+
+
+class SyncWorkGroupResource(SyncKelvinResource):
+    resource_class = WorkGroupResource
@@ -0,0 +1,111 @@
+#
+# Copyright 2026 Univention GmbH
+#
+# http://www.univention.de/
+#
+# All rights reserved.
+#
+# The source code of this program is made available
+# under the terms of the GNU Affero General Public License version 3
+# (GNU AGPL V3) as published by the Free Software Foundation.
+#
+# Binary versions of this program provided by Univention to you as
+# well as other copyrighted, protected or trademarked materials like
+# Logos, graphics, fonts, specific documentations and configurations,
+# cryptographic keys etc. are subject to a license agreement between
+# you and Univention and not subject to the GNU AGPL V3.
+#
+# In the case you use this program under the terms of the GNU AGPL V3,
+# the program is provided in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License with the Debian GNU/Linux or Univention distribution in file
+# /usr/share/common-licenses/AGPL-3; if not, see
+# <http://www.gnu.org/licenses/>.
+
+import contextlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # not available on Windows
+    fcntl = None
+
+
+def _default_token_store_path() -> Path:
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_dir) / "kelvin-rest-api-client" / "tokens.json"
+
+
+class TokenStore:
+    """
+    Storage for tokens, that can be shared between `Session` objects, even in different
+    processes.
+
+    `Session` asks the store for a token before requesting a new one from the Kelvin API and
+    puts every newly retrieved token into the store. Expired or broken tokens returned by
+    `get()` are ignored by the `Session`.
+    """
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, token: str) -> None:
+        raise NotImplementedError
+
+
+class FileTokenStore(TokenStore):
+    """
+    Stores tokens in a JSON file, readable only by the owner. Access is serialized with an
+    exclusive lock on a separate lock file, so the file can be used by multiple processes.
+
+    :param path: path of the JSON file, defaults to
+        ``$XDG_CACHE_HOME/kelvin-rest-api-client/tokens.json``
+    """
+
+    def __init__(self, path: Union[str, Path] = None):
+        self.path = Path(path) if path else _default_token_store_path()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._locked():
+            return self._read().get(key)
+
+    def set(self, key: str, token: str) -> None:
+        with self._locked():
+            tokens = self._read()
+            tokens[key] = token
+            self._write(tokens)
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # closing the file descriptor releases the lock
+            os.close(fd)
+
+    def _read(self) -> Dict[str, str]:
+        try:
+            with self.path.open("r") as fp:
+                tokens = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+        return tokens if isinstance(tokens, dict) else {}
+
+    def _write(self, tokens: Dict[str, str]) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as fp:
+            json.dump(tokens, fp)
+        os.replace(tmp_path, self.path)